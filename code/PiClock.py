@@ -1,10 +1,10 @@
 #!/usr/bin/python3
 
 
+from argparse import ArgumentParser
 from signal import pause
-from time import sleep
 
-import RPi.GPIO as GPIO
+from asyncruntime import AsyncRuntime
 from clock import Clock
 from config_canvases import *
 from config_images import *
@@ -12,13 +12,15 @@ from config_leddisplay import *
 from config_openweathermap import *
 from getweatherdata import GetWeatherData
 from leddisplay import LEDDisplay
+from matrixbackend import BACKENDS, create_matrix
+from notifier import AsyncChangeNotifier, ChangeNotifier
 from pir_gpio import PIR
+from pirinput import PIR_INPUTS, create_pir_input
+from renderstats import StartupTimer, StatsFileWriter, StatsSocketServer, process_stats
 from rotate_canvas import RotateCanvas
+from scheduler import RUNTIMES, Scheduler
 from weather import Weather
-
-# Set up GPIO
-GPIO.setmode(GPIO.BCM)
-GPIO.setwarnings(False)
+from weatherprovider import PROVIDERS, create_provider
 
 # -----------------------------------------------------------------------------
 # Delays and various others
@@ -30,63 +32,86 @@ turnscreenoffdelay = 300
 # The pin the PIR output is connected to
 pirpin = 25
 
-# The number of seconds between refreshing the weather from the forecast data
-refreshweatherinterval = 300
+# The seconds the PIR output must be steady after changing before it is believed
+pirdebounce = 0.05
+
+# Where movement is read from: 'gpio' for the PIR, or 'simulated' to always see movement (or to repeat
+# pirsimulatedcycle)
+pirinput = 'gpio'
+
+# The seconds of movement then of no movement the simulated PIR repeats, e.g. (10, 400) to see the display turn off
+# after turnscreenoffdelay and back on, or None to always see movement
+pirsimulatedcycle = None
+
+# How the widgets are run: 'scheduler' for all of them from one thread woken on wall clock boundaries, 'threads' for a
+# thread each, or 'asyncio' for all of them on one event loop
+runtime = 'scheduler'
 
 # The number of seconds between changes of the smaller weather displays at the bottom
 rotatesmallweatherinterval = 5
 
 # -----------------------------------------------------------------------------
-# Initialise the PIR Detection class
+# The display, PIR and weather can be changed on the command line, so the clock can run without the LED Matrix, GPIO
+# or network
 # -----------------------------------------------------------------------------
-MovementPIR = PIR(pirpin, turnscreenoffdelay)
-MovementPIR.start()
+parser = ArgumentParser(description='PiClock')
+parser.add_argument('--display', choices=BACKENDS, default=DisplayBackend, help='what the display is drawn on')
+parser.add_argument('--frames', default=DisplayFramesDirectory, help="where the 'png' display saves frames")
+parser.add_argument('--pir', choices=PIR_INPUTS, default=pirinput, help='where movement is read from')
+parser.add_argument('--pir-cycle', nargs=2, type=float, default=pirsimulatedcycle, metavar=('MOVEMENT', 'STILL'),
+                    help='the seconds of movement then of none the simulated PIR repeats')
+parser.add_argument('--runtime', choices=RUNTIMES, default=runtime, help='how the widgets are run')
+parser.add_argument('--weather', choices=PROVIDERS, default=WeatherProvider, help='where the forecast is read from')
+arguments = parser.parse_args()
 
 # -----------------------------------------------------------------------------
-# Initialise the Weather Forecast retrieval class
+# Start reading the weather first, so it is fetched while everything else starts. Nothing waits for it: the forecast
+# saved by the last run is shown until it arrives, or a placeholder if there isn't a recent one
 # -----------------------------------------------------------------------------
-TheWeather = GetWeatherData(OpenWeatherMapKey, WeatherURLFormat, CityLocation, WeatherUnits,
-                            SecondsBetweenWeatherRefresh, SecondsBetweemWeatherRefreshOnError)
-TheWeather.start()
-sleep(1)
+Startup = StartupTimer()
+
+WeatherSource = create_provider(arguments.weather, OpenWeatherMapKey, WeatherURLFormat, CityLocation, WeatherUnits,
+                                WeatherReplayFiles)
+TheWeather = GetWeatherData(WeatherSource, SecondsBetweenWeatherRefresh, SecondsBetweemWeatherRefreshOnError,
+                            WeatherCacheDirectory, WeatherCacheMaxAge)
+TheScheduler = Scheduler() if arguments.runtime == 'scheduler' else None
+
+
+def forecast_updated(version):
+    # The first update is the first forecast, whether from the cache or read
+    if TheWeather.haveforecasts:
+        Startup.milestone('firstforecast')
+    # Redraw the weather only when there is a new forecast or a forecast slot has ended
+    if TheScheduler is not None:
+        for name in ('WeatherNow', 'WeatherPlus3', 'WeatherPlus6', 'WeatherPlus9'):
+            TheScheduler.trigger(name)
 
-while not TheWeather.haveforecasts:
-    print("Waiting for weather")
-    sleep(1)
+
+TheWeather.subscribe(forecast_updated)
+TheWeather.load_cache()
+if arguments.runtime != 'asyncio':
+    TheWeather.start()
+Startup.phase('weather')
+
+# -----------------------------------------------------------------------------
+# Initialise the PIR Detection class
+# -----------------------------------------------------------------------------
+MovementPIR = PIR(create_pir_input(arguments.pir, pirpin, arguments.pir_cycle), turnscreenoffdelay, pirdebounce)
+MovementPIR.start()
+Startup.phase('pir')
 
 # -----------------------------------------------------------------------------
 # Define the Matrix Layout by initialising the Clock and Weather classes
 # -----------------------------------------------------------------------------
-Time = Clock(TimeCanvas, 12)
-sleep(0.1)
-Date = Clock(DateCanvas, -1)
-sleep(0.1)
-
-WeatherNow = Weather(WeatherCanvas, 0, refreshweatherinterval, TheWeather)
-sleep(0.1)
-WeatherPlus3 = Weather(WeatherPlusCanvas, 3, refreshweatherinterval, TheWeather)
-sleep(0.1)
-WeatherPlus6 = Weather(WeatherPlusCanvas, 6, refreshweatherinterval, TheWeather)
-sleep(0.1)
-WeatherPlus9 = Weather(WeatherPlusCanvas, 9, refreshweatherinterval, TheWeather)
-sleep(0.1)
+Time = Clock(TimeCanvas, 12, CanvasFramebuffer, ClockFaceCacheSize)
+Date = Clock(DateCanvas, -1, CanvasFramebuffer)
+
+WeatherNow = Weather(WeatherCanvas, 0, TheWeather, CanvasFramebuffer)
+WeatherPlus3 = Weather(WeatherPlusCanvas, 3, TheWeather, CanvasFramebuffer)
+WeatherPlus6 = Weather(WeatherPlusCanvas, 6, TheWeather, CanvasFramebuffer)
+WeatherPlus9 = Weather(WeatherPlusCanvas, 9, TheWeather, CanvasFramebuffer)
 RotatedView = RotateCanvas((WeatherPlus3, WeatherPlus6, WeatherPlus9), rotatesmallweatherinterval)
-sleep(0.1)
-
-Time.start()
-sleep(0.1)
-Date.start()
-sleep(0.1)
-WeatherNow.start()
-sleep(0.1)
-WeatherPlus3.start()
-sleep(0.1)
-WeatherPlus6.start()
-sleep(0.1)
-WeatherPlus9.start()
-sleep(0.1)
-RotatedView.start()
-sleep(0.1)
+Startup.phase('components')
 
 # -----------------------------------------------------------------------------
 # Initialise the LEDDisplay
@@ -96,8 +121,65 @@ CanvasPositions["Date"][1] = Date
 CanvasPositions["WeatherNow"][1] = WeatherNow
 CanvasPositions["RotateWeather"][1] = RotatedView
 
-MyLEDs = LEDDisplay(LEDFormat, CanvasPositions, MovementPIR)
-MyLEDs.start()
+DisplayNotifier = AsyncChangeNotifier() if arguments.runtime == 'asyncio' else ChangeNotifier()
+MyLEDs = LEDDisplay(LEDFormat, CanvasPositions, MovementPIR, create_matrix(LEDFormat, arguments.display,
+                                                                           arguments.frames), Startup, DisplayNotifier)
+Startup.phase('display')
+
+# Start drawing. The display is woken by each component as it publishes its first canvas, so the order doesn't matter
+if arguments.runtime == 'threads':
+    for component in (MyLEDs, Time, Date, WeatherNow, WeatherPlus3, WeatherPlus6, WeatherPlus9, RotatedView):
+        component.start()
+    Startup.phase('start')
+elif arguments.runtime == 'scheduler':
+    # The weather is only redrawn when triggered by forecast_updated
+    TheScheduler.add_job('Time', Time.step, 1, align=1)
+    TheScheduler.add_job('Date', Date.step, 300, align=60)
+    TheScheduler.add_job('WeatherNow', WeatherNow.step, None)
+    TheScheduler.add_job('WeatherPlus3', WeatherPlus3.step, None)
+    TheScheduler.add_job('WeatherPlus6', WeatherPlus6.step, None)
+    TheScheduler.add_job('WeatherPlus9', WeatherPlus9.step, None)
+    TheScheduler.add_job('RotateWeather', RotatedView.rotate, rotatesmallweatherinterval,
+                         align=rotatesmallweatherinterval)
+    # Nothing is redrawn while the display is off, and everything is redrawn as it wakes
+    MyLEDs.add_power_listener(lambda displayon: TheScheduler.set_paused(not displayon))
+    MyLEDs.start()
+    TheScheduler.start()
+    Startup.phase('start')
 
-# Forever!
-pause()
+# -----------------------------------------------------------------------------
+# Make the frame timings and cache usage available while running
+# -----------------------------------------------------------------------------
+def collect_stats():
+    stats = MyLEDs.stats
+    stats['atlas'] = GalleryAtlas.stats
+    stats['text'] = GlyphText.stats
+    stats['clockfaces'] = Time.facecachestats
+    stats['startup'] = Startup.snapshot
+    stats['runtime'] = arguments.runtime
+    stats['weather'] = TheWeather.fetchstats
+    stats['process'] = process_stats()
+    if TheScheduler is not None:
+        stats['scheduler'] = TheScheduler.stats
+    return stats
+
+
+if arguments.runtime != 'asyncio':
+    if RenderStatsFile is not None:
+        StatsFileWriter(collect_stats, RenderStatsFile, RenderStatsInterval).start()
+    if RenderStatsSocket is not None:
+        StatsSocketServer(collect_stats, RenderStatsSocket).start()
+
+    # Forever!
+    pause()
+else:
+    Runtime = AsyncRuntime(MyLEDs, DisplayNotifier, (Time, Date, RotatedView), TheWeather,
+                           (WeatherNow, WeatherPlus3, WeatherPlus6, WeatherPlus9))
+    if RenderStatsFile is not None:
+        Runtime.add_statsfile(StatsFileWriter(collect_stats, RenderStatsFile, RenderStatsInterval))
+    if RenderStatsSocket is not None:
+        Runtime.add_statssocket(collect_stats, RenderStatsSocket)
+    Startup.phase('start')
+
+    # Forever!
+    Runtime.run()
@@ -0,0 +1,220 @@
+"""
+Compiles the image galleries into a single asset bundle, and loads them from it
+
+The bundle is two files in the images directory: assets.rgb, holding the pixels of every gallery as raw RGB one after
+the other, and assets.json, the index saying where each gallery is and which position tables it was checked against.
+At startup the pixels are memory mapped rather than decoded from the PNGs, and only the sub-images actually drawn are
+read.
+
+Run this file to (re)compile the bundle after changing any of the images or position tables:
+    python3 assetbundle.py
+"""
+import json
+import mmap
+import os
+
+from PIL import Image
+
+BUNDLE_NAME = 'assets.rgb'
+INDEX_NAME = 'assets.json'
+BUNDLE_VERSION = 1
+
+
+class BundleGallery:
+    """
+    A gallery image held in the memory mapped bundle. It has the parts of the PIL Image interface used to slice
+    sub-images from a gallery
+    """
+    mode = 'RGB'
+
+    def __init__(self, bundle, offset, size):
+        """
+        :param bundle: The memory mapped bundle
+        :param offset: The position of the first pixel of the gallery in the bundle
+        :param size: The (width, height) of the gallery
+        """
+        self.__bundle = bundle
+        self.__offset = offset
+        self.size = size
+
+    @property
+    def width(self):
+        return self.size[0]
+
+    @property
+    def height(self):
+        return self.size[1]
+
+    def crop(self, box):
+        """
+        Returns a region of the gallery as a new image
+
+        :param box: (left, top, right, bottom), right and bottom exclusive. It must be within the gallery
+        :return:
+        """
+        left, top, right, bottom = box
+        stride = self.size[0] * 3
+        rows = b''.join(self.__bundle[self.__offset + row * stride + left * 3:self.__offset + row * stride + right * 3]
+                        for row in range(top, bottom))
+        return Image.frombytes('RGB', (right - left, bottom - top), rows)
+
+    def load(self):
+        """ The pixels are read as they are cropped, so there is nothing to load """
+        pass
+
+
+class GalleryLoader:
+    """
+    Opens the gallery images, from the asset bundle if there is one which is up to date with the PNG, otherwise from
+    the PNG. Each image file is only opened once, however many position tables use it
+    """
+
+    def __init__(self, imagepath):
+        """
+        :param imagepath: The directory holding the images and the bundle
+        """
+        self.__imagepath = imagepath
+        self.__galleries = {}
+        self.__index = {}
+        self.__bundle = None
+
+        try:
+            with open(os.path.join(imagepath, INDEX_NAME)) as indexfile:
+                index = json.load(indexfile)
+            if index.get('version') == BUNDLE_VERSION:
+                with open(os.path.join(imagepath, BUNDLE_NAME), 'rb') as bundlefile:
+                    self.__bundle = mmap.mmap(bundlefile.fileno(), 0, access=mmap.ACCESS_READ)
+                self.__index = index['galleries']
+        except (OSError, ValueError, KeyError):
+            self.__index = {}
+
+    def open(self, imagename, positions):
+        """
+        Returns a gallery image
+
+        :param imagename: The file name of the image
+        :param positions: The position table used with the image
+        :return: A BundleGallery, or a PIL image if the image is not in the bundle
+        """
+        gallery = self.__galleries.get(imagename)
+        if gallery is None:
+            gallery = self.__open_bundled(imagename)
+            if gallery is None:
+                # Decode the PNG now, as PIL can't decode it from several drawing threads at once
+                gallery = Image.open(self.__imagepath + imagename)
+                gallery.load()
+            self.__galleries[imagename] = gallery
+
+        if (isinstance(gallery, BundleGallery) and
+                encode_positions(positions) not in self.__index[imagename]['positions']):
+            print('The positions used with {} have changed since the asset bundle was compiled. Run assetbundle.py '
+                  'to check them'.format(imagename))
+        return gallery
+
+    @property
+    def bundled(self):
+        """ Returns the names of the images opened from the bundle """
+        return sorted(name for name, gallery in self.__galleries.items() if isinstance(gallery, BundleGallery))
+
+    def __open_bundled(self, imagename):
+        """
+        Returns the gallery from the bundle, or None if it is not there or the PNG has changed since it was compiled
+
+        :param imagename:
+        :return:
+        """
+        entry = self.__index.get(imagename)
+        if entry is None:
+            return None
+        try:
+            source = os.stat(self.__imagepath + imagename)
+        except OSError:
+            source = None
+        if source is not None and (source.st_size, int(source.st_mtime)) != tuple(entry['source']):
+            return None
+        return BundleGallery(self.__bundle, entry['offset'], tuple(entry['size']))
+
+
+def encode_positions(positions):
+    """
+    Returns a position table in the form it is kept in the index. JSON objects can only have string keys, so the
+    table is kept as a list of [key, box] pairs to keep keys such as 0 and '0' apart
+
+    :param positions: A position table, e.g. {'1': (0, 0, 4, 7), ...}
+    :return:
+    """
+    return sorted(([key, list(box)] for key, box in positions.items()), key=repr)
+
+
+def check_positions(imagename, size, positions):
+    """
+    Checks every box in a position table is a (left, top, right, bottom) tuple of whole numbers inside the image
+
+    :param imagename: The image file name, for the error message
+    :param size: The (width, height) of the image
+    :param positions: The position table
+    :raises ValueError: If any box is malformed
+    """
+    for key, box in positions.items():
+        if (not isinstance(box, tuple) or len(box) != 4 or
+                not all(isinstance(value, int) and not isinstance(value, bool) for value in box)):
+            raise ValueError('{} {!r}: {!r} is not a (left, top, right, bottom) tuple'.format(imagename, key, box))
+        left, top, right, bottom = box
+        if left > right or top > bottom:
+            raise ValueError('{} {!r}: {!r} has its corners the wrong way round'.format(imagename, key, box))
+        if left < 0 or top < 0 or right >= size[0] or bottom >= size[1]:
+            raise ValueError('{} {!r}: {!r} is outside the {}x{} image'.format(imagename, key, box, size[0], size[1]))
+
+
+def compile_bundle(imagepath, imagefiles):
+    """
+    Packs the gallery images into the bundle, after checking their position tables
+
+    :param imagepath: The directory holding the images. The bundle is written there
+    :param imagefiles: A sequence of (image file name, position table). A file may appear more than once
+    :return: The index written
+    :raises ValueError: If a position table is malformed. Nothing is written
+    """
+    galleries = {}
+    pixels = []
+    offset = 0
+    for imagename, positions in imagefiles:
+        entry = galleries.get(imagename)
+        if entry is None:
+            image = Image.open(imagepath + imagename).convert('RGB')
+            source = os.stat(imagepath + imagename)
+            entry = {'offset': offset,
+                     'size': list(image.size),
+                     'source': [source.st_size, int(source.st_mtime)],
+                     'positions': []}
+            galleries[imagename] = entry
+            data = image.tobytes()
+            pixels.append(data)
+            offset += len(data)
+
+        check_positions(imagename, tuple(entry['size']), positions)
+        if encode_positions(positions) not in entry['positions']:
+            entry['positions'].append(encode_positions(positions))
+
+    index = {'version': BUNDLE_VERSION, 'galleries': galleries}
+
+    # Write both files under temporary names first, so a running clock never sees half a bundle
+    bundlename = os.path.join(imagepath, BUNDLE_NAME)
+    indexname = os.path.join(imagepath, INDEX_NAME)
+    with open(bundlename + '.tmp', 'wb') as bundlefile:
+        bundlefile.write(b''.join(pixels))
+    with open(indexname + '.tmp', 'w') as indexfile:
+        json.dump(index, indexfile, indent=1)
+    os.replace(bundlename + '.tmp', bundlename)
+    os.replace(indexname + '.tmp', indexname)
+
+    return index
+
+
+if __name__ == '__main__':
+    import config_images
+
+    compiledindex = compile_bundle(config_images.imagepath, config_images.imagefiles)
+    for name, compiled in compiledindex['galleries'].items():
+        print('{:20} {:>4}x{:<4} {} position table(s)'.format(name, compiled['size'][0], compiled['size'][1],
+                                                            len(compiled['positions'])))
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from getweatherdata import CONNECT_TIMEOUT, FETCH_SPACING, READ_TIMEOUT
+from renderstats import remove_stale_socket
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class AsyncRuntime:
+    """
+    Runs the clock on a single asyncio event loop instead of a thread per widget. Each widget is a coroutine calling the
+    widget's step() and sleeping for as long as it returns, or while the display is off. The Weather widgets instead
+    sleep until the GetWeatherData has an update. The matrix calls which block (SetImage/SwapOnVSync and the fades) are
+    run on one worker thread. Reading the forecast when aiohttp is not installed runs on the loop's default executor
+    instead, so a slow read can't hold up the display
+    """
+
+    def __init__(self, display, notifier, widgets, weatherdata, weatherwidgets):
+        """
+        :param display: The LEDDisplay, created with notifier
+        :param notifier: The AsyncChangeNotifier the display waits on
+        :param widgets: The widgets with a step() which doesn't block (clocks, RotateCanvas)
+        :param weatherdata: The GetWeatherData
+        :param weatherwidgets: The Weather widgets, which are only woken when the GetWeatherData has an update
+        """
+        self.__display = display
+        self.__notifier = notifier
+        self.__widgets = widgets
+        self.__weatherdata = weatherdata
+        self.__weatherwidgets = weatherwidgets
+
+        self.__executor = ThreadPoolExecutor(max_workers=1)
+        self.__extratasks = []
+
+    def add_statsfile(self, writer):
+        """
+        Writes the statistics from the loop, rather than from the StatsFileWriter's own thread
+
+        :param writer: A StatsFileWriter, which is not started
+        """
+        self.__extratasks.append(self.__run_statsfile(writer))
+
+    def add_statssocket(self, statsfunction, socketpath):
+        """
+        Serves the statistics on a Unix socket from the loop, as the StatsSocketServer does
+
+        :param statsfunction: A function returning the statistics as a dictionary
+        :param socketpath: The path of the Unix socket
+        """
+        self.__extratasks.append(self.__serve_stats(statsfunction, socketpath))
+
+    def run(self):
+        """ Runs the clock until the process is stopped """
+        asyncio.run(self.__main())
+
+    async def __main(self):
+        tasks = [self.__run_display(), self.__run_weatherdata()]
+        tasks.extend(self.__run_widget(widget) for widget in self.__widgets)
+        tasks.extend(self.__run_weather(widget) for widget in self.__weatherwidgets)
+        tasks.extend(self.__extratasks)
+        await asyncio.gather(*tasks)
+
+    async def __run_display(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await loop.run_in_executor(self.__executor, self.__display.step)
+            await self.__notifier.wait()
+
+    async def __run_widget(self, widget):
+        while True:
+            await self.__notifier.sleep(widget.step())
+
+    async def __run_weather(self, widget):
+        # Updates are published from whichever thread stores the forecast, so are passed to the loop
+        loop = asyncio.get_running_loop()
+        updated = asyncio.Event()
+        self.__weatherdata.subscribe(lambda version: loop.call_soon_threadsafe(updated.set))
+        while True:
+            widget.step()
+            await updated.wait()
+            updated.clear()
+            # Don't draw while the display is off; the update is drawn when it comes back on
+            await self.__notifier.sleep(0)
+
+    async def __run_weatherdata(self):
+        loop = asyncio.get_running_loop()
+        weatherdata = self.__weatherdata
+
+        session = None
+        if aiohttp is not None:
+            session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(connect=CONNECT_TIMEOUT,
+                                                                          sock_read=READ_TIMEOUT))
+        try:
+            while True:
+                weatherdata.check_slot_boundary()
+                source, wait = weatherdata.next_fetch()
+                if source is None:
+                    wait = weatherdata.refreshfrequency
+                if wait > 0:
+                    # Wake at the end of the forecast slot, so the widgets move on to the next one
+                    await asyncio.sleep(min(wait, weatherdata.seconds_to_slot_boundary()))
+                    continue
+
+                # Only a provider reading over HTTP can be read with aiohttp
+                if session is None or source.url is None:
+                    await loop.run_in_executor(None, weatherdata.fetch, source)
+                else:
+                    # The lock may be held by another clock sharing the cache, so is waited for off the loop
+                    lockfile = await loop.run_in_executor(None, weatherdata.lock_cache, source)
+                    try:
+                        await self.__fetch_weather(session, source)
+                    finally:
+                        weatherdata.unlock_cache(lockfile)
+                await asyncio.sleep(min(FETCH_SPACING, weatherdata.seconds_to_slot_boundary()))
+        finally:
+            if session is not None:
+                await session.close()
+
+    async def __fetch_weather(self, session, source):
+        """
+        Reads a forecast with aiohttp, as GetWeatherData.fetch does with requests. The forecast saved by another clock
+        sharing the cache is used if there is a newer one. The caller must hold the source's cache lock
+
+        :param session: The aiohttp ClientSession
+        :param source: The ForecastSource to read
+        """
+        weatherdata = self.__weatherdata
+        if weatherdata.read_shared(source):
+            return
+        fetchstart = time.perf_counter()
+        try:
+            async with session.get(source.url, headers=source.conditional_headers) as response:
+                body = await response.read()
+                forecasts = json.loads(body) if response.status == 200 else None
+                # aiohttp has decompressed the body, so the bytes received are only known from the Content-Length
+                weatherdata.fetched(source, response.status, response.headers, forecasts,
+                                    time.perf_counter() - fetchstart, response.content_length, len(body))
+        except Exception:
+            weatherdata.failed(source, time.perf_counter() - fetchstart)
+
+    @staticmethod
+    async def __run_statsfile(writer):
+        while True:
+            await asyncio.sleep(writer.interval)
+            writer.write()
+
+    @staticmethod
+    async def __serve_stats(statsfunction, socketpath):
+        async def send_stats(reader, writer):
+            writer.write(json.dumps(statsfunction()).encode() + b'\n')
+            await writer.drain()
+            writer.close()
+
+        try:
+            remove_stale_socket(socketpath)
+        except OSError as error:
+            print('Error serving statistics: {}'.format(error))
+            return
+        server = await asyncio.start_unix_server(send_stats, path=socketpath)
+        async with server:
+            await server.serve_forever()
@@ -0,0 +1,88 @@
+from lrucache import LRUCache
+
+
+class ImageAtlas:
+    """
+    A cache of the sub-images held in the image galleries, so each sub-image is only cropped from its gallery once and
+    can then be pasted straight onto a canvas
+    """
+
+    def __init__(self, maxbytes):
+        """
+        :param maxbytes: The most memory (in bytes of pixel data) the cached sub-images may use before the least
+                         recently used are evicted
+        """
+        self.__tiles = LRUCache(maxbytes, self.__tile_size)
+
+    def get_tile(self, galleryimage, gallerypositions, whichimage, asarray=False):
+        """
+        Returns the sub-image whichimage from a gallery, cropping it from the gallery if it is not already cached
+
+        :param galleryimage: A single image containing all the images
+        :param gallerypositions: contains the locations of the images in galleryimage
+        :param whichimage: The sub-image contained in the gallery
+        :param asarray: Return the sub-image as an RGB NumPy array (height x width x 3) rather than an image
+        :return: A single image, which must not be changed by the caller
+        """
+        box = gallerypositions[whichimage]
+        # Key on the box rather than the name, so images sharing a position (e.g. 'blank' and 'rain0.0') share a tile
+        key = (id(galleryimage), box, asarray)
+
+        tile = self.__tiles.get(key)
+        if tile is not None:
+            return tile
+
+        tile = self.__extract_image_from_gallery(galleryimage, box)
+        if asarray:
+            import numpy
+
+            tile = numpy.asarray(tile.convert('RGB'))
+
+        return self.__tiles.put(key, tile)
+
+    def preload(self, galleryimage, gallerypositions, asarray=False):
+        """
+        Slices every sub-image out of a gallery so later draws are a straight paste
+
+        :param galleryimage: A single image containing all the images
+        :param gallerypositions: contains the locations of the images in galleryimage
+        :param asarray: Slice the sub-images into NumPy arrays rather than images
+        """
+        for whichimage in gallerypositions:
+            self.get_tile(galleryimage, gallerypositions, whichimage, asarray)
+
+    def clear(self):
+        """ Empties the cache """
+        self.__tiles.clear()
+
+    @property
+    def stats(self):
+        """ Returns a dictionary of the cache usage """
+        stats = self.__tiles.stats
+        return {'tiles': stats['entries'],
+                'bytes': stats['size'],
+                'maxbytes': stats['maxsize'],
+                'hits': stats['hits'],
+                'misses': stats['misses'],
+                'evictions': stats['evictions']}
+
+    @staticmethod
+    def __tile_size(tile):
+        if hasattr(tile, 'nbytes'):
+            return tile.nbytes
+        return tile.width * tile.height * len(tile.getbands())
+
+    @staticmethod
+    def __extract_image_from_gallery(galleryimage, gallerypositions):
+        """
+        Extract an image from a 'gallery' image
+
+        :param galleryimage: A single image containing all the images
+        :param gallerypositions: contains the location of the image in galleryimage
+        :return: A single image
+        """
+        singleimage = galleryimage.crop(
+            (gallerypositions[0], gallerypositions[1], gallerypositions[2] + 1, gallerypositions[3] + 1))
+        singleimage.load()
+
+        return singleimage
@@ -0,0 +1,451 @@
+#!/usr/bin/python3
+"""
+Benchmarks for the PiClock render and forecast paths. They need neither the LED Matrix nor the network.
+
+    python3 benchmarks.py                          run them all
+    python3 benchmarks.py clock                    run those whose name contains 'clock'
+    python3 benchmarks.py --save-baseline          save the results as the baseline
+    python3 benchmarks.py --compare                flag any benchmark slower than the baseline
+"""
+import copy
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+from argparse import ArgumentParser
+from timeit import Timer
+
+from clock import Clock
+from config_canvases import *
+from config_leddisplay import LEDFormat
+from forecast import FORECAST_SLOT_SECONDS
+from framebuffer import create_framebuffer
+from getweatherdata import GetWeatherData
+from leddisplay import LEDDisplay
+from matrixbackend import create_matrix, matrix_size
+from stubserver import StubServer
+from weather import Weather
+from weatherprovider import OpenWeatherMapProvider, shift_forecast
+
+BENCHDATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchdata')
+
+# A forecast recorded from OpenWeatherMap (2.5 /forecast, 40 three hour slots)
+RECORDED_FORECAST = os.path.join(BENCHDATA, 'owm_forecast.json')
+BASELINE_FILE = os.path.join(BENCHDATA, 'baseline.json')
+
+# A benchmark is flagged as a regression if it is this much slower than its baseline
+REGRESSION_THRESHOLD = 0.2
+
+DISPLAY_SIZE = matrix_size(LEDFormat)
+
+# The clock face cache size the facecache benchmarks use, whatever ClockFaceCacheSize is set to
+BENCH_FACECACHESIZE = 2880
+
+# The canvases shown on the display and where they are placed, as in config_leddisplay
+COMPONENT_LAYOUT = ((TimeCanvas, (0, 0)),
+                    (DateCanvas, (37, 0)),
+                    (WeatherCanvas, (0, 16)),
+                    (WeatherPlusCanvas, (0, 48)))
+
+
+class StillPIR:
+    """ A PIR that always sees movement """
+    hasbeenmovement = True
+
+    def set_notifier(self, notifier):
+        pass
+
+
+def load_forecast(slots=None):
+    """
+    Loads the recorded forecast, moved in time so its first slot is the current one
+
+    :param slots: The number of slots wanted. The recorded slots are repeated if more are wanted than were recorded
+    :return: The forecast, as decoded from the OpenWeatherMap JSON
+    """
+    with open(RECORDED_FORECAST) as forecastfile:
+        forecast = json.load(forecastfile)
+
+    recorded = forecast['list']
+    slots = slots or len(recorded)
+
+    # Repeat the recorded slots, three hours apart, then move them all so the first covers now
+    forecast['list'] = []
+    for slot in range(slots):
+        entry = copy.deepcopy(recorded[slot % len(recorded)])
+        entry['dt'] = recorded[0]['dt'] + FORECAST_SLOT_SECONDS * slot
+        forecast['list'].append(entry)
+    forecast['cnt'] = slots
+
+    return shift_forecast(forecast)
+
+    return forecast
+
+
+def make_weatherdata(slots=None):
+    """ Returns a GetWeatherData holding the recorded forecast, without fetching anything """
+    weatherdata = GetWeatherData(OpenWeatherMapProvider('', '', 0, ''), 0, 0)
+    weatherdata.set_forecasts(load_forecast(slots))
+    return weatherdata
+
+
+def bench_clock_time(framebuffer, facecachesize=0):
+    """ Redraws the whole time (hours, colon, minutes), as happens when the hour changes """
+    clock = Clock(TimeCanvas, 12, framebuffer, facecachesize)
+
+    def draw_time():
+        clock._Clock__CurrentHour = -1
+        clock._Clock__CurrentMinute = -1
+        clock._Clock__CurrentSecond = -1
+        clock._Clock__draw_time()
+
+    return draw_time
+
+
+def bench_clock_tick(framebuffer, facecachesize=0):
+    """ The work done by the time clock each second, when only the colon changes """
+    clock = Clock(TimeCanvas, 12, framebuffer, facecachesize)
+    clock._Clock__draw_time()
+
+    def tick():
+        clock._Clock__CurrentSecond = -1
+        clock._Clock__draw_time()
+        clock._Clock__Publisher.publish()
+
+    return tick
+
+
+def bench_clock_date(framebuffer):
+    """ Redraws the whole date (day of the week, day and month) """
+    clock = Clock(DateCanvas, -1, framebuffer)
+
+    def draw_date():
+        clock._Clock__CurrentDoW = -1
+        clock._Clock__CurrentDay = -1
+        clock._Clock__CurrentMonth = -1
+        clock._Clock__draw_date()
+
+    return draw_date
+
+
+def make_weather(framebuffer, definition=WeatherCanvas, hoursfromnow=0):
+    """ Returns a Weather holding the readable forecast from the recorded forecast """
+    weatherdata = make_weatherdata()
+    weather = Weather(definition, hoursfromnow, weatherdata, framebuffer)
+    weather._Weather__WeatherForecast = weatherdata.get_weatherforecast(hoursfromnow)
+    return weather
+
+
+def bench_weather_canvas(framebuffer):
+    """ Redraws the whole weather canvas """
+    weather = make_weather(framebuffer)
+
+    def draw_weather():
+        weather._Weather__CurrentWeatherIcon = ''
+        weather._Weather__CurrentWeatherMaxTemp = 999.0
+        weather._Weather__CurrentWeatherMinTemp = -999.0
+        weather._Weather__WindSpeedIcon = False
+        weather._Weather__CurrentWeatherWind = -1
+        weather._Weather__RainSnowIcon = ''
+        weather._Weather__CurrentWeatherRain = -1.0
+        weather._Weather__CurrentWeatherSnow = -1.0
+        weather._Weather__CurrentWeatherTime = -1
+        weather._Weather__draw_weather_canvas()
+
+    return draw_weather
+
+
+def bench_weather_temperature(framebuffer):
+    """ Draws a maximum temperature """
+    weather = make_weather(framebuffer)
+
+    def draw_temperature():
+        weather._Weather__draw_temperature('MaxTemp', 12.3, 'C')
+
+    return draw_temperature
+
+
+def bench_weather_step_unchanged(framebuffer):
+    """ The work done by a Weather told of an update which doesn't change the slot it shows """
+    weather = make_weather(framebuffer)
+    weather.step()
+
+    def step():
+        weather.step()
+
+    return step
+
+
+def bench_display_compose(framebuffer):
+    """
+    Composes a full frame from all the component canvases and sends it to an in-memory matrix, as the LEDDisplay does
+    when it redraws everything
+    """
+    components = []
+    for definition, position in COMPONENT_LAYOUT:
+        components.append((position, create_framebuffer(definition['Size'][0], definition['Size'][1], framebuffer)))
+
+    screendefinition = dict(LEDFormat, framebuffer=framebuffer)
+    display = LEDDisplay(screendefinition, {}, StillPIR(), create_matrix(screendefinition, 'memory'))
+
+    def compose():
+        for position, canvas in components:
+            display._LEDDisplay__paste_to_displaycanvas(position, canvas)
+        display._LEDDisplay__lastframe = None
+        display._LEDDisplay__updatedisplay()
+
+    return compose
+
+
+def bench_get_weatherforecast(slots=None, hoursfromnow=9):
+    """ Finds the forecast hoursfromnow hours from now """
+    weatherdata = make_weatherdata(slots)
+
+    def get_forecast():
+        return weatherdata.get_weatherforecast(hoursfromnow)
+
+    return get_forecast
+
+
+def bench_get_passed_weatherforecast():
+    """ Finds the current forecast when its slot has already been dropped from the forecast """
+    forecast = load_forecast()
+    forecast['list'] = forecast['list'][1:]
+    weatherdata = GetWeatherData(OpenWeatherMapProvider('', '', 0, ''), 0, 0)
+    weatherdata.set_forecasts(forecast)
+
+    def get_forecast():
+        return weatherdata.get_weatherforecast(0)
+
+    return get_forecast
+
+
+def bench_set_forecasts(slots=None):
+    """ Stores and indexes a forecast, as happens each time it is read """
+    forecast = load_forecast(slots)
+    weatherdata = GetWeatherData(OpenWeatherMapProvider('', '', 0, ''), 0, 0)
+
+    def set_forecasts():
+        weatherdata.set_forecasts(forecast)
+
+    return set_forecasts
+
+
+def bench_forecast_slot():
+    """ Decodes a forecast slot into the form the Weather draws """
+    slotjson = load_forecast()['list'][1]
+
+    def forecast_slot():
+        return OpenWeatherMapProvider.decode_slot(slotjson)
+
+    return forecast_slot
+
+
+def bench_decode_slots(slots=None):
+    """ Converts every slot of a forecast into the form the Weather draws, as happens each time it is read """
+    slotsjson = load_forecast(slots)['list']
+
+    def decode_slots():
+        return OpenWeatherMapProvider.decode_slots(slotsjson)
+
+    return decode_slots
+
+
+def bench_fetch(conditional):
+    """
+    Reads the forecast from a local stub of OpenWeatherMap.org, over the kept-open connection, as GetWeatherData does
+    each refresh
+
+    :param conditional: True if the forecast has been read before, so the stub answers 304 Not Modified
+    """
+    server = StubServer([RECORDED_FORECAST])
+    server.start()
+    weatherdata = GetWeatherData(OpenWeatherMapProvider('key', server.url, 0, ''), 300, 60)
+    source, _ = weatherdata.next_fetch()
+    weatherdata.fetch(source)
+
+    def fetch():
+        if not conditional:
+            source.validators = {}
+        weatherdata.fetch(source)
+
+    return fetch
+
+
+def bench_fetch_shared():
+    """
+    Reads the forecast when another clock sharing the cache directory has just read it, so the saved copy is used
+    rather than asking the stub of OpenWeatherMap.org
+    """
+    server = StubServer([RECORDED_FORECAST])
+    server.start()
+    cachedirectory = tempfile.TemporaryDirectory()
+    reader = GetWeatherData(OpenWeatherMapProvider('key', server.url, 0, ''), 300, 60, cachedirectory.name)
+    reader.fetch(reader.next_fetch()[0])
+
+    weatherdata = GetWeatherData(OpenWeatherMapProvider('key', server.url, 0, ''), 300, 60, cachedirectory.name)
+    source, _ = weatherdata.next_fetch()
+
+    def fetch():
+        # Holding the directory keeps it until the benchmark has finished
+        assert cachedirectory
+        source.fetched = 0
+        weatherdata.fetch(source)
+
+    return fetch
+
+
+def all_benchmarks():
+    """
+    Returns every benchmark
+
+    :return: A list of (name, function which returns the function to time)
+    """
+    benchmarks = []
+    for framebuffer in ('pil', 'numpy'):
+        benchmarks += [('clock.draw_time[{}]'.format(framebuffer), lambda fb=framebuffer: bench_clock_time(fb)),
+                       ('clock.draw_time[{},facecache]'.format(framebuffer),
+                        lambda fb=framebuffer: bench_clock_time(fb, BENCH_FACECACHESIZE)),
+                       ('clock.tick[{}]'.format(framebuffer), lambda fb=framebuffer: bench_clock_tick(fb)),
+                       ('clock.tick[{},facecache]'.format(framebuffer),
+                        lambda fb=framebuffer: bench_clock_tick(fb, BENCH_FACECACHESIZE)),
+                       ('clock.draw_date[{}]'.format(framebuffer), lambda fb=framebuffer: bench_clock_date(fb)),
+                       ('weather.draw_weather_canvas[{}]'.format(framebuffer),
+                        lambda fb=framebuffer: bench_weather_canvas(fb)),
+                       ('weather.draw_temperature[{}]'.format(framebuffer),
+                        lambda fb=framebuffer: bench_weather_temperature(fb)),
+                       ('weather.step[{},unchanged]'.format(framebuffer),
+                        lambda fb=framebuffer: bench_weather_step_unchanged(fb)),
+                       ('leddisplay.compose[{}]'.format(framebuffer), lambda fb=framebuffer: bench_display_compose(fb))]
+    benchmarks += [('forecast.get_weatherforecast', bench_get_weatherforecast),
+                   ('forecast.get_weatherforecast[5 days]', lambda: bench_get_weatherforecast(40)),
+                   ('forecast.get_weatherforecast[30 days]', lambda: bench_get_weatherforecast(240)),
+                   ('forecast.get_weatherforecast[1 year]', lambda: bench_get_weatherforecast(2920)),
+                   ('forecast.get_weatherforecast[passed]', bench_get_passed_weatherforecast),
+                   ('forecast.set_forecasts', bench_set_forecasts),
+                   ('forecast.set_forecasts[30 days]', lambda: bench_set_forecasts(240)),
+                   ('forecast.forecast_slot', bench_forecast_slot),
+                   ('forecast.decode_slots', bench_decode_slots),
+                   ('forecast.decode_slots[30 days]', lambda: bench_decode_slots(240)),
+                   ('forecast.fetch[stub]', lambda: bench_fetch(False)),
+                   ('forecast.fetch[stub,not modified]', lambda: bench_fetch(True)),
+                   ('forecast.fetch[shared cache]', bench_fetch_shared)]
+    return benchmarks
+
+
+def measure_allocations(function, number):
+    """
+    Measures the memory allocated while running function
+
+    :param function:
+    :param number: The number of calls to average over
+    :return: (bytes allocated per call, memory blocks still allocated per call)
+    """
+    tracemalloc.start()
+    try:
+        function()
+        blocksbefore = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+        allocated = 0
+        for _ in range(number):
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            function()
+            allocated += tracemalloc.get_traced_memory()[1] - current
+        blocksafter = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+    finally:
+        tracemalloc.stop()
+    return allocated / number, (blocksafter - blocksbefore) / number
+
+
+def run_benchmark(name, function, repeat=5):
+    """
+    Times a function and measures its memory allocation
+
+    :param name:
+    :param function:
+    :param repeat: The number of timings, the fastest of which is reported
+    :return: A dictionary of the results
+    """
+    timer = Timer(function)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+    allocated, retained = measure_allocations(function, min(number, 200))
+
+    return {'name': name,
+            'us_per_op': round(best * 1e6, 2),
+            'ops_per_sec': round(1.0 / best),
+            'bytes_per_op': round(allocated),
+            'retained_blocks_per_op': round(retained, 2)}
+
+
+def compare_with_baseline(results, baseline):
+    """
+    Prints how each result compares with its baseline
+
+    :param results:
+    :param baseline:
+    :return: The names of the benchmarks that have regressed
+    """
+    regressions = []
+    for result in results:
+        if result['name'] not in baseline:
+            continue
+        before = baseline[result['name']]['us_per_op']
+        change = (result['us_per_op'] - before) / before
+        flag = ''
+        if change > REGRESSION_THRESHOLD:
+            flag = 'REGRESSION'
+            regressions.append(result['name'])
+        print('{:<40} {:>10.2f} -> {:>10.2f} us/op {:>+7.0%} {}'.format(result['name'], before, result['us_per_op'],
+                                                                       change, flag))
+    return regressions
+
+
+def main():
+    parser = ArgumentParser(description='PiClock benchmarks')
+    parser.add_argument('filter', nargs='?', default='', help='only run benchmarks whose name contains this')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='the baseline file')
+    parser.add_argument('--save-baseline', action='store_true', help='save the results as the baseline')
+    parser.add_argument('--compare', action='store_true', help='compare the results with the baseline')
+    parser.add_argument('--json', help='also write the results to this file')
+    arguments = parser.parse_args()
+
+    results = []
+    print('{:<40} {:>10} {:>12} {:>10} {:>10}'.format('benchmark', 'us/op', 'ops/sec', 'bytes/op', 'kept/op'))
+    for name, setup in all_benchmarks():
+        if arguments.filter in name:
+            result = run_benchmark(name, setup())
+            results.append(result)
+            print('{name:<40} {us_per_op:>10.2f} {ops_per_sec:>12} {bytes_per_op:>10} '
+                  '{retained_blocks_per_op:>10}'.format(**result))
+
+    if arguments.json:
+        with open(arguments.json, 'w') as jsonfile:
+            json.dump(results, jsonfile, indent=1)
+
+    regressions = []
+    if arguments.compare:
+        if not os.path.exists(arguments.baseline):
+            print('No baseline saved at {}; run --save-baseline first'.format(arguments.baseline))
+            sys.exit(1)
+        with open(arguments.baseline) as baselinefile:
+            baseline = json.load(baselinefile)
+        print()
+        regressions = compare_with_baseline(results, baseline)
+
+    if arguments.save_baseline:
+        baseline = {}
+        if os.path.exists(arguments.baseline):
+            with open(arguments.baseline) as baselinefile:
+                baseline = json.load(baselinefile)
+        baseline.update({result['name']: result for result in results})
+        with open(arguments.baseline, 'w') as baselinefile:
+            json.dump(baseline, baselinefile, indent=1, sort_keys=True)
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,18 @@
+import threading
+
 from PIL import Image
 
+from config_images import GalleryAtlas
+
+# Once a canvas has collected this many damaged regions they are merged into one bounding box
+MAX_DAMAGE_REGIONS = 8
+
 
 class Canvas:
     """
     An image canvas onto which images are drawn on and stored before being drawn on the LEDDisplay
+    The canvas remembers which regions have been drawn on (damaged) since they were last taken, so only those regions
+    need to be copied to the display
     """
 
     def __init__(self, x, y):
@@ -11,21 +20,8 @@ class Canvas:
         self.__canvassize_x, self.__canvassize_y = x, y
         self.__Image = Image.new('RGB', (x, y))
 
-    @staticmethod
-    def __extract_image_from_gallery(galleryimage, gallerypositions):
-        """
-        Extract an image from a 'gallery' image
-
-        :param galleryimage: A single image containing all the images
-        :param gallerypositions: contains the locations of the images in galleryimage
-        :return: A single image
-        """
-        # Now get the image from file (no error checking yet!)
-        singleimage = galleryimage.crop(
-            (gallerypositions[0], gallerypositions[1], gallerypositions[2] + 1, gallerypositions[3] + 1))
-        singleimage.load()
-
-        return singleimage
+        self.__damage = []
+        self.__damagelock = threading.Lock()
 
     @property
     def get_canvassize_x(self):
@@ -56,15 +52,78 @@ class Canvas:
         # If the image is on the canvas, draw it
         if (imagestart_x <= self.__canvassize_x and imagestart_y <= self.__canvassize_y) and (
                 imagexend > 0 and imageyend > 0):
-            croppedimage = self.__extract_image_from_gallery(imagegallery, imagegallerypositions[whichimage])
-            self.__Image.paste(croppedimage, (imagestart_x, imagestart_y))
+            tile = GalleryAtlas.get_tile(imagegallery, imagegallerypositions, whichimage)
+            self.__Image.paste(tile, (imagestart_x, imagestart_y))
+            self.__add_damage((imagestart_x, imagestart_y, imagexend + 1, imageyend + 1))
 
     def crop(self, imagebox):
         return self.__Image.crop(imagebox)
 
+    def copy_from(self, canvas, imagebox, position):
+        """
+        Copies a region of another canvas onto this canvas
+
+        :param canvas: The canvas to copy from
+        :param imagebox: The (left, top, right, bottom) region of canvas to copy
+        :param position: The (x, y) position on this canvas to copy it to
+        """
+        imagetocopy = canvas.crop(imagebox)
+        imagetocopy.load()
+        self.paste(imagetocopy, position)
+
+    def tobytes(self):
+        """ Returns the pixels of the canvas as RGB bytes """
+        return self.__Image.tobytes()
+
+    def copy(self):
+        """ Returns a new canvas holding a copy of this canvas's pixels, with no damage """
+        copied = Canvas(self.__canvassize_x, self.__canvassize_y)
+        copied.__Image = self.__Image.copy()
+        return copied
+
     def paste(self, imagetopaste, position):
         self.__Image.paste(imagetopaste, box=position)
+        self.__add_damage((position[0], position[1],
+                           position[0] + imagetopaste.width, position[1] + imagetopaste.height))
+
+    def take_damage(self):
+        """
+        Returns the regions drawn on since the last call, and forgets them
+
+        :return: A list of (left, top, right, bottom) boxes, right and bottom exclusive
+        """
+        with self.__damagelock:
+            damage = self.__damage
+            self.__damage = []
+        return damage
+
+    def __add_damage(self, box):
+        """
+        Records a damaged region, clipped to the canvas
+
+        :param box: (left, top, right, bottom), right and bottom exclusive
+        """
+        box = (max(box[0], 0), max(box[1], 0),
+               min(box[2], self.__canvassize_x), min(box[3], self.__canvassize_y))
+        if box[0] >= box[2] or box[1] >= box[3]:
+            return
+
+        with self.__damagelock:
+            self.__damage.append(box)
+            if len(self.__damage) > MAX_DAMAGE_REGIONS:
+                self.__damage = [bounding_box(self.__damage)]
 
     @property
     def Image(self):
         return self.__Image
+
+
+def bounding_box(boxes):
+    """
+    Returns the smallest box containing all the boxes
+
+    :param boxes: A list of (left, top, right, bottom) boxes
+    :return: A single (left, top, right, bottom) box
+    """
+    return (min(box[0] for box in boxes), min(box[1] for box in boxes),
+            max(box[2] for box in boxes), max(box[3] for box in boxes))
@@ -1,24 +1,31 @@
-import threading
-from time import time, sleep, localtime
+from time import time, localtime
 from datetime import datetime
 
-from canvas import Canvas
+from clockface import ClockFaceCache
+from config_images import GlyphText
+from framebuffer import create_framebuffer
+from notifier import WidgetThread
+from snapshot import CanvasPublisher
 
 
-class Clock(threading.Thread):
+class Clock(WidgetThread):
     """ Draws the date and/or time on a canvases """
 
-    def __init__(self, clockdefinition, clock1224):
+    def __init__(self, clockdefinition, clock1224, framebuffer='pil', facecachesize=0):
         """
         :param clockdefinition: The definition of what should be in the clock (Time, DoW, Month or Day(date))
         :param clock1224: = 12 for 12 hour clock, or 24 for 24 hour clock
+        :param framebuffer: The type of canvas to draw on, 'pil' or 'numpy'
+        :param facecachesize: The number of complete clock faces to keep, so the time is drawn by pasting a whole
+                              face rather than digit by digit. 0 to draw digit by digit
         """
         self.__ClockDefinition = clockdefinition
         self.__Clock24h = clock1224
 
-        # Create a canvas for the Clock - this is what will be updated
-        self.__ClockCanvas = Canvas(clockdefinition['Size'][0], clockdefinition['Size'][1])
-        self.__HasImageChanged = True
+        # Create a canvas for the Clock - this is what will be updated. It is only drawn on by this thread, and copies
+        # of it are published for the display to read
+        self.__ClockCanvas = create_framebuffer(clockdefinition['Size'][0], clockdefinition['Size'][1], framebuffer)
+        self.__Publisher = CanvasPublisher(self.__ClockCanvas)
 
         self.__CurrentHour = -1
         self.__CurrentMinute = -1
@@ -27,30 +34,56 @@ class Clock(threading.Thread):
         self.__CurrentMonth = -1
         self.__CurrentDoW = -1
 
+        self.__FaceCache = None
+        if 'Time' in clockdefinition:
+            self.__TimePositions = self.__time_positions()
+            if facecachesize > 0:
+                self.__FaceCache = ClockFaceCache(facecachesize, clockdefinition['Size'], framebuffer,
+                                                  self.__render_face)
+
         super(Clock, self).__init__()
 
     def run(self):
         """ Update the time every second. The time can be 12h or 24h """
         while True:
-            delay = 300
-            if 'Day' in self.__ClockDefinition and self.__CurrentDay != datetime.today():
-                self.__draw_date()
-            if 'Time' in self.__ClockDefinition:
-                self.__draw_time()
-                delay = 1.0 - float(time() % 1)
-            sleep(delay)
+            self.sleep_between_steps(self.step())
 
-    @property
-    def haschanged(self):
-        if self.__HasImageChanged:
-            self.__HasImageChanged = False
-            return True
-        else:
-            return False
+    def step(self):
+        """
+        Draws whatever has changed since the last step, and publishes the canvas
+
+        :return: The seconds until the next step
+        """
+        delay = 300
+        if 'Day' in self.__ClockDefinition and self.__CurrentDay != datetime.today():
+            self.__draw_date()
+        if 'Time' in self.__ClockDefinition:
+            self.__draw_time()
+            delay = 1.0 - float(time() % 1)
+        if self.__Publisher.publish():
+            self.notify_changed()
+        return delay
 
     @property
     def get_canvas(self):
-        return self.__ClockCanvas
+        """ Returns the canvas as it was last published. It must not be drawn on """
+        return self.__Publisher.snapshot.canvas
+
+    @property
+    def facecachestats(self):
+        """ Returns the usage of the clock face cache, or None if it is not used """
+        if self.__FaceCache is None:
+            return None
+        return self.__FaceCache.stats
+
+    def changes_since(self, generation):
+        """
+        Returns the latest snapshot of the canvas, and the regions changed since an earlier generation
+
+        :param generation: The generation last drawn, or None
+        :return: (CanvasSnapshot, damage). See CanvasPublisher.changes_since
+        """
+        return self.__Publisher.changes_since(generation)
 
     def __draw_date(self):
         """ Updates the date """
@@ -62,7 +95,6 @@ class Clock(threading.Thread):
                 if self.__CurrentDoW != datedow:
                     self.__CurrentDoW = datedow
                     self.__ClockCanvas.draw_on_canvas(self.__ClockDefinition['DoW'], self.__CurrentDoW)
-                    self.__HasImageChanged = True
 
         if 'Day' in self.__ClockDefinition:
             if self.__ClockDefinition['Day'] != {}:
@@ -70,7 +102,6 @@ class Clock(threading.Thread):
                 if self.__CurrentDay != dateday:
                     self.__CurrentDay = dateday
                     self.__draw_day()
-                    self.__HasImageChanged = True
 
         if 'Month' in self.__ClockDefinition:
             if self.__ClockDefinition['Month'] != {}:
@@ -78,88 +109,46 @@ class Clock(threading.Thread):
                 if self.__CurrentMonth != datemonth:
                     self.__CurrentMonth = datemonth
                     self.__ClockCanvas.draw_on_canvas(self.__ClockDefinition['Month'], self.__CurrentMonth)
-                    self.__HasImageChanged = True
 
-    def __draw_clock_digit(self, position, digit):
+    def __draw_clock_digit(self, position, digit, canvas=None):
         """
         Draw an individual clock digit at the pre-defined position (x, y) tuple
 
         :param position:
         :param digit:
+        :param canvas: The canvas to draw on, if not the clock canvas
         """
-        self.__ClockCanvas.draw_on_canvas(
+        if canvas is None:
+            canvas = self.__ClockCanvas
+        canvas.draw_on_canvas(
             (position[0], position[1], self.__ClockDefinition['Time'][2], self.__ClockDefinition['Time'][3]), digit)
 
     def __draw_day(self):
         """
         Update the day (date), consisting of a one or two digit number
         """
-        x = self.__ClockDefinition['Day'][0]
-        y = self.__ClockDefinition['Day'][1]
-        image = self.__ClockDefinition['Day'][2]
-        imagedefinition = self.__ClockDefinition['Day'][3]
-
-        # 10's digit
-        if self.__CurrentDay >= 10.0:
-            tensdigit = str(abs(int(self.__CurrentDay)))[0]
-            self.__ClockCanvas.draw_on_canvas((x, y, image, imagedefinition), tensdigit)
-            x = self.__add_image_width(x, imagedefinition[tensdigit])
-        else:
-            tensdigit = 0
-            self.__ClockCanvas.draw_on_canvas((x, y, image, imagedefinition), 'sp')
-            x = self.__add_image_width(x, imagedefinition['sp'])
-
-        # Units digit
-        unitdigit = str(abs(int(self.__CurrentDay)) - (int(tensdigit) * 10))
-        self.__ClockCanvas.draw_on_canvas((x, y, image, imagedefinition), unitdigit)
+        day = str(abs(int(self.__CurrentDay)))
+        if len(day) == 1:
+            day = ('sp', day)
+        GlyphText.draw(self.__ClockCanvas, self.__ClockDefinition['Day'], day)
 
     def __draw_time(self):
         """
         Update the time display, hh:mm a/p
         """
-        x = self.__ClockDefinition['Time'][0]
-        y = self.__ClockDefinition['Time'][1]
-        imagedefinition = self.__ClockDefinition['Time'][3]
+        currenttime = localtime()
 
-        # The font is assumed to be non-proportional for all but the : and am/pm
-        # Calculate the positions of the various items
-        xhourtens = x
-        xhourunits = self.__add_image_width(xhourtens, imagedefinition[1])
-        xcolon = self.__add_image_width(xhourunits, imagedefinition[1])
-        xminutetens = self.__add_image_width(xcolon, imagedefinition[':'])
-        xminuteunits = self.__add_image_width(xminutetens, imagedefinition[1])
-        xampm = self.__add_image_width(xminuteunits, imagedefinition[1])
+        if self.__FaceCache is not None:
+            self.__draw_cached_time(currenttime)
+            return
 
-        # Get the current hour
-        currenttime = localtime()
+        y = self.__ClockDefinition['Time'][1]
+        xhourtens, xhourunits, xcolon, xminutetens, xminuteunits, xampm = self.__TimePositions
 
         # Only update the hour if it has changed
         if currenttime.tm_hour != self.__CurrentHour:
             self.__CurrentHour = currenttime.tm_hour
-            self.__HasImageChanged = True
-            if self.__Clock24h == 12:
-                # Change to 12 hour clock
-                if currenttime.tm_hour > 12:
-                    hour = self.__CurrentHour - 12
-                    ampm = 1
-                else:
-                    hour = self.__CurrentHour
-                    ampm = 0
-            else:
-                # 24 hour
-                hour = self.__CurrentHour
-                ampm = -1
-
-            # Draw the hours - first digit
-            if hour >= 20:
-                firstdigit = 2
-                seconddigit = hour - 20
-            elif hour >= 10:
-                firstdigit = 1
-                seconddigit = hour - 10
-            else:
-                firstdigit = ' '
-                seconddigit = hour
+            firstdigit, seconddigit, ampm = self.__hour_digits(self.__CurrentHour)
 
             # Draw the first digit
             self.__draw_clock_digit((xhourtens, y), firstdigit)
@@ -167,35 +156,118 @@ class Clock(threading.Thread):
             self.__draw_clock_digit((xhourunits, y), seconddigit)
 
             # Draw AM/PM
-            if ampm == 0:
-                self.__draw_clock_digit((xampm, y), 'am')
-            elif ampm == 1:
-                self.__draw_clock_digit((xampm, y), 'pm')
+            if ampm is not None:
+                self.__draw_clock_digit((xampm, y), ampm)
 
         # Draw the : flashing each second
         if currenttime.tm_sec != self.__CurrentSecond:
-            self.__HasImageChanged = True
             self.__CurrentSecond = currenttime.tm_sec
-            if self.__CurrentSecond / 2.0 == int(self.__CurrentSecond / 2):
-                self.__draw_clock_digit((xcolon, y), ':')
-            else:
-                self.__draw_clock_digit((xcolon, y), ': ')
+            self.__draw_clock_digit((xcolon, y), self.__colon(self.__CurrentSecond))
 
         # Only update the minutes if they have changed
         if currenttime.tm_min != self.__CurrentMinute:
-            self.__HasImageChanged = True
             self.__CurrentMinute = currenttime.tm_min
-
-            if self.__CurrentMinute < 10:
-                minute_firstdigit = 0
-                minute_seconddigit = self.__CurrentMinute
-            else:
-                minute_firstdigit = int(str(self.__CurrentMinute)[0])
-                minute_seconddigit = int(str(self.__CurrentMinute)[1])
+            minute_firstdigit, minute_seconddigit = self.__minute_digits(self.__CurrentMinute)
 
             self.__draw_clock_digit((xminutetens, y), minute_firstdigit)
             self.__draw_clock_digit((xminuteunits, y), minute_seconddigit)
 
+    def __draw_cached_time(self, currenttime):
+        """
+        Update the time display by pasting the whole pre-drawn clock face for the time
+
+        :param currenttime: The time to show
+        """
+        if (currenttime.tm_hour, currenttime.tm_min, currenttime.tm_sec) != (
+                self.__CurrentHour, self.__CurrentMinute, self.__CurrentSecond):
+            self.__CurrentHour = currenttime.tm_hour
+            self.__CurrentMinute = currenttime.tm_min
+            self.__CurrentSecond = currenttime.tm_sec
+            face = self.__FaceCache.get_face(self.__CurrentHour, self.__CurrentMinute,
+                                             self.__colon(self.__CurrentSecond))
+            self.__ClockCanvas.paste(face, (0, 0))
+
+    def __render_face(self, canvas, hour, minute, colon):
+        """
+        Draws the complete time onto a blank canvas
+
+        :param canvas: The canvas to draw on
+        :param hour: 0-23
+        :param minute: 0-59
+        :param colon: ':' or ': ' (the colon turned off)
+        """
+        y = self.__ClockDefinition['Time'][1]
+        xhourtens, xhourunits, xcolon, xminutetens, xminuteunits, xampm = self.__TimePositions
+
+        firstdigit, seconddigit, ampm = self.__hour_digits(hour)
+        minute_firstdigit, minute_seconddigit = self.__minute_digits(minute)
+
+        self.__draw_clock_digit((xhourtens, y), firstdigit, canvas)
+        self.__draw_clock_digit((xhourunits, y), seconddigit, canvas)
+        self.__draw_clock_digit((xcolon, y), colon, canvas)
+        self.__draw_clock_digit((xminutetens, y), minute_firstdigit, canvas)
+        self.__draw_clock_digit((xminuteunits, y), minute_seconddigit, canvas)
+        if ampm is not None:
+            self.__draw_clock_digit((xampm, y), ampm, canvas)
+
+    def __time_positions(self):
+        """
+        Calculate the x positions of the hour tens, hour units, colon, minute tens, minute units and am/pm
+        The font is assumed to be non-proportional for all but the : and am/pm
+        """
+        imagedefinition = self.__ClockDefinition['Time'][3]
+
+        xhourtens = self.__ClockDefinition['Time'][0]
+        xhourunits = self.__add_image_width(xhourtens, imagedefinition[1])
+        xcolon = self.__add_image_width(xhourunits, imagedefinition[1])
+        xminutetens = self.__add_image_width(xcolon, imagedefinition[':'])
+        xminuteunits = self.__add_image_width(xminutetens, imagedefinition[1])
+        xampm = self.__add_image_width(xminuteunits, imagedefinition[1])
+
+        return xhourtens, xhourunits, xcolon, xminutetens, xminuteunits, xampm
+
+    def __hour_digits(self, hour):
+        """
+        Works out the hour digits to draw
+
+        :param hour: 0-23
+        :return: (first digit, second digit, 'am'/'pm' or None for a 24 hour clock)
+        """
+        if self.__Clock24h == 12:
+            # Change to 12 hour clock
+            if hour > 12:
+                hour = hour - 12
+                ampm = 'pm'
+            else:
+                ampm = 'am'
+        else:
+            # 24 hour
+            ampm = None
+
+        if hour >= 20:
+            return 2, hour - 20, ampm
+        elif hour >= 10:
+            return 1, hour - 10, ampm
+        else:
+            return ' ', hour, ampm
+
+    @staticmethod
+    def __minute_digits(minute):
+        """
+        Works out the minute digits to draw
+
+        :param minute: 0-59
+        :return: (first digit, second digit)
+        """
+        return minute // 10, minute % 10
+
+    @staticmethod
+    def __colon(second):
+        """ The colon is shown on even seconds """
+        if second % 2 == 0:
+            return ':'
+        return ': '
+
     @staticmethod
     def __add_image_width(x, imagedef):
         """
@@ -0,0 +1,59 @@
+from framebuffer import NumpyCanvas, create_framebuffer
+from lrucache import LRUCache
+
+
+class ClockFaceCache:
+    """
+    Keeps complete, pre-drawn clock faces (the whole time canvas) for each hour, minute and colon state, so drawing the
+    time each second is a single paste. Faces are drawn the first time they are needed, and the least recently used
+    are dropped once maxfaces are held
+    """
+
+    def __init__(self, maxfaces, size, framebuffer, renderfunction):
+        """
+        :param maxfaces: The most faces to keep
+        :param size: The (x, y) size of a face
+        :param framebuffer: The type of canvas the faces are drawn on, 'pil' or 'numpy'
+        :param renderfunction: Called as renderfunction(canvas, hour, minute, colon) to draw a face on a blank canvas
+        """
+        self.__size = size
+        self.__framebuffer = framebuffer
+        self.__renderfunction = renderfunction
+
+        self.__faces = LRUCache(maxfaces)
+        self.__facebytes = size[0] * size[1] * 3
+
+    def get_face(self, hour, minute, colon):
+        """
+        Returns the face for a time, drawing it if it is not already kept
+
+        :param hour: 0-23
+        :param minute: 0-59
+        :param colon: ':' or ': ' (the colon turned off)
+        :return: An image (or an array for NumPy canvases) which can be pasted onto the clock canvas
+        """
+        key = (hour, minute, colon)
+        face = self.__faces.get(key)
+        if face is not None:
+            return face
+
+        canvas = create_framebuffer(self.__size[0], self.__size[1], self.__framebuffer)
+        self.__renderfunction(canvas, hour, minute, colon)
+        if isinstance(canvas, NumpyCanvas):
+            face = canvas.pixels
+        else:
+            face = canvas.Image
+
+        return self.__faces.put(key, face)
+
+    @property
+    def stats(self):
+        """ Returns a dictionary of the cache usage """
+        stats = self.__faces.stats
+        return {'faces': stats['entries'],
+                'maxfaces': stats['maxsize'],
+                'bytes': stats['entries'] * self.__facebytes,
+                'maxbytes': stats['maxsize'] * self.__facebytes,
+                'hits': stats['hits'],
+                'misses': stats['misses'],
+                'evictions': stats['evictions']}
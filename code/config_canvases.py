@@ -1,5 +1,14 @@
 from config_images import *
 
+# The type of canvas the clock and weather are drawn on: 'numpy' (falls back to 'pil' if NumPy is not installed) or
+# 'pil'
+CanvasFramebuffer = 'numpy'
+
+# The number of complete time canvases (one per hour, minute and colon state) the time clock keeps, so each second is a
+# single paste, or 0 to draw the digits each time. A minute only needs two; 2880 keeps every face of the day (about
+# 5MB). Each paste redraws the whole canvas rather than just the colon, so it is off by default
+ClockFaceCacheSize = 0
+
 # ----------------------------------------------------------------------------------------------------------------------
 # Definitions of each canvas
 # The format of the 'def' dictionary is:
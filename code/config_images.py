@@ -1,16 +1,23 @@
-from PIL import Image
+import os
+
+from assetbundle import GalleryLoader
+from atlas import ImageAtlas
+from glyphtext import TextRenderer
 
 # -----------------------------------------------------------------------------
 # Images
 # -----------------------------------------------------------------------------
-imagepath = '/home/pi/PiClock/images/'
+imagepath = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'images', '')
+
+# The galleries are memory mapped from the compiled asset bundle (see assetbundle.py) if there is one, otherwise they
+# are opened from the PNGs. Galleries sharing a file (e.g. the rain/snow and wind images) are only opened once
+Galleries = GalleryLoader(imagepath)
 
 # The 'position' dictionaries show the top left and bottom right positions of
 # each image within the image
 
 # Small font used for temperature
 imagename_smallfont = 'smallfont.png'
-image_smallfont = Image.open(imagepath + imagename_smallfont)
 imagepositions_smallfont = {'1': (0, 0, 4, 7),
                             '2': (5, 0, 9, 7),
                             '3': (10, 0, 14, 7),
@@ -30,6 +37,7 @@ imagepositions_smallfont = {'1': (0, 0, 4, 7),
                             '-': (76, 0, 78, 7),
                             'sp': (80, 0, 84, 7),
                             'ssp': (80, 0, 82, 7)}
+image_smallfont = Galleries.open(imagename_smallfont, imagepositions_smallfont)
 
 # Clock Font
 # The clock needs to contain the following characters:
@@ -37,7 +45,6 @@ imagepositions_smallfont = {'1': (0, 0, 4, 7),
 # There is a full space (same size as digits) between 9 and :
 # and a small space between 2 and a which is the same width as the 1
 imagename_clockfont = 'clockfont.png'
-image_clockfont = Image.open(imagepath + imagename_clockfont)
 imagepositions_clockfont = {0: (0, 0, 6, 15),
                             1: (8, 0, 14, 15),
                             2: (16, 0, 22, 15),
@@ -53,13 +60,13 @@ imagepositions_clockfont = {0: (0, 0, 6, 15),
                             ': ': (92, 0, 94, 15),
                             'am': (95, 0, 99, 15),
                             'pm': (100, 0, 104, 15)}
+image_clockfont = Galleries.open(imagename_clockfont, imagepositions_clockfont)
 
 # Weather Icons
 # The weather icons are as per the OpenWeatherMap icons on
 # http://openweathermap.org/weather-conditions
 # They are arranged in a 9x2 grid, daytime icons on the top, nighttime on the bottom
 imagename_weather32 = 'OWMweather.png'
-image_weather32 = Image.open(imagepath + imagename_weather32)
 imagepositions_weather32 = {'01d': (0, 0, 31, 31),
                             '02d': (32, 0, 63, 31),
                             '03d': (64, 0, 95, 31),
@@ -78,10 +85,10 @@ imagepositions_weather32 = {'01d': (0, 0, 31, 31),
                             '11n': (192, 32, 223, 63),
                             '13n': (224, 32, 255, 63),
                             '50n': (256, 32, 287, 63)}
+image_weather32 = Galleries.open(imagename_weather32, imagepositions_weather32)
 
 # Small version (16x16) of the weather icons
 imagename_weather16 = 'OWMweather16.png'
-image_weather16 = Image.open(imagepath + imagename_weather16)
 imagepositions_weather16 = {'01d': (0, 0, 15, 15),
                             '02d': (16, 0, 31, 15),
                             '03d': (32, 0, 47, 15),
@@ -100,11 +107,11 @@ imagepositions_weather16 = {'01d': (0, 0, 15, 15),
                             '11n': (96, 16, 111, 31),
                             '13n': (112, 16, 127, 31),
                             '50n': (128, 16, 143, 31)}
+image_weather16 = Galleries.open(imagename_weather16, imagepositions_weather16)
 
 # Rain and Snow warning images
 # Rain is in 0.5mm divisions, snow is in 1mm
 imagename_rainsnow = 'weatherwarn.png'
-image_rainsnow = Image.open(imagepath + imagename_rainsnow)
 imagepositions_rainsnow = {'RainIcon': (0, 0, 7, 7),
                            'rain0.0': (8, 24, 23, 31),
                            'rain0.5': (8, 0, 8, 7),
@@ -142,10 +149,10 @@ imagepositions_rainsnow = {'RainIcon': (0, 0, 7, 7),
                            'snow15': (8, 16, 22, 23),
                            'snow16': (8, 16, 23, 23),
                            'blank': (8, 24, 23, 31)}
+image_rainsnow = Galleries.open(imagename_rainsnow, imagepositions_rainsnow)
 
 # Wind warning images (Beaufort Scale)
 imagename_wind = 'weatherwarn.png'
-image_wind = Image.open(imagepath + imagename_wind)
 imagepositions_wind = {'Icon': (0, 8, 7, 15),
                        'blank': (8, 24, 23, 31),
                        0: (8, 24, 23, 31),
@@ -161,11 +168,11 @@ imagepositions_wind = {'Icon': (0, 8, 7, 15),
                        10: (8, 8, 17, 15),
                        11: (8, 8, 18, 15),
                        12: (8, 8, 19, 15)}
+image_wind = Galleries.open(imagename_wind, imagepositions_wind)
 
 # Day Names
 # 0=Monday, 1=Tuesday etc (standard Linux)
 imagename_dow = 'DoW.png'
-image_dow = Image.open(imagepath + imagename_dow)
 imagepositions_dow = {0: (0, 8, 16, 15),
                       1: (0, 16, 16, 23),
                       2: (0, 24, 16, 31),
@@ -173,11 +180,11 @@ imagepositions_dow = {0: (0, 8, 16, 15),
                       4: (0, 40, 16, 47),
                       5: (0, 48, 16, 55),
                       6: (0, 0, 16, 7)}
+image_dow = Galleries.open(imagename_dow, imagepositions_dow)
 
 # Month Names
 # 1=January etc
 imagename_month = 'months.png'
-image_month = Image.open(imagepath + imagename_month)
 imagepositions_month = {1: (0, 0, 27, 7),
                         2: (0, 8, 27, 15),
                         3: (0, 16, 27, 23),
@@ -190,11 +197,11 @@ imagepositions_month = {1: (0, 0, 27, 7),
                         10: (0, 72, 27, 79),
                         11: (0, 80, 27, 87),
                         12: (0, 88, 27, 95)}
+image_month = Galleries.open(imagename_month, imagepositions_month)
 
 # The forecast clock
 # Shows which 3 hours the forecast covers
 imagename_weatherclock = 'clocktimes8.png'
-image_weatherclock = Image.open(imagepath + imagename_weatherclock)
 imagepositions_weatherclock = {0: (0, 0, 7, 7),
                                3: (8, 0, 15, 7),
                                6: (16, 0, 23, 7),
@@ -203,10 +210,10 @@ imagepositions_weatherclock = {0: (0, 0, 7, 7),
                                15: (8, 0, 15, 7),
                                18: (16, 0, 23, 7),
                                21: (24, 0, 31, 7)}
+image_weatherclock = Galleries.open(imagename_weatherclock, imagepositions_weatherclock)
 
 # Date font Images
 imagename_date = 'datefont.png'
-image_date = Image.open(imagepath + imagename_date)
 imagepositions_date = {'1': (0, 0, 4, 7),
                        '2': (5, 0, 9, 7),
                        '3': (10, 0, 14, 7),
@@ -218,8 +225,35 @@ imagepositions_date = {'1': (0, 0, 4, 7),
                        '9': (40, 0, 44, 7),
                        '0': (45, 0, 49, 7),
                        'sp': (80, 0, 84, 7)}
+image_date = Galleries.open(imagename_date, imagepositions_date)
 
 # temperature font Images
 imagename_temperature = imagename_smallfont
-image_temperature = Image.open(imagepath + imagename_temperature)
 imagepositions_temperature = imagepositions_smallfont
+image_temperature = Galleries.open(imagename_temperature, imagepositions_temperature)
+
+# -----------------------------------------------------------------------------
+# Image atlas
+# -----------------------------------------------------------------------------
+# The sub-images are cropped from the galleries once and cached, rather than on every draw.
+# atlasmaxbytes limits the memory used by the cached sub-images (all of the galleries fit in about 100KB)
+atlasmaxbytes = 256 * 1024
+GalleryAtlas = ImageAtlas(atlasmaxbytes)
+
+# Strings of glyphs (temperatures, dates) are rendered once and kept. textcachesize limits how many are kept
+textcachesize = 256
+GlyphText = TextRenderer(GalleryAtlas, textcachesize)
+
+# Every image file and the positions used with it, for compiling the asset bundle
+imagefiles = ((imagename_smallfont, imagepositions_smallfont),
+              (imagename_clockfont, imagepositions_clockfont),
+              (imagename_weather32, imagepositions_weather32),
+              (imagename_weather16, imagepositions_weather16),
+              (imagename_rainsnow, imagepositions_rainsnow),
+              (imagename_wind, imagepositions_wind),
+              (imagename_dow, imagepositions_dow),
+              (imagename_month, imagepositions_month),
+              (imagename_weatherclock, imagepositions_weatherclock),
+              (imagename_date, imagepositions_date),
+              (imagename_temperature, imagepositions_temperature))
+
@@ -7,12 +7,29 @@
 #   matrixHeight = Height of the matrix
 #   matrixCount = Number of screens
 #   matrixFlip = Flip the even matrices (1=true)
+#   framebuffer = 'numpy' to compose the display in a NumPy array (falls back to 'pil' if NumPy is not installed)
+#   fade = 'hardware' to fade using the matrix brightness, or 'lut' to fade by scaling the pixels
 
 LEDFormat = {"matrixRows": 32,
              "matrixCols": 64,
              "matrixCount": 2,
              "matrixMapper": "U-mapper;Rotate:180",
-             "matrixDriver": "adafruit-hat-pwm"}
+             "matrixDriver": "adafruit-hat-pwm",
+             "framebuffer": "numpy",
+             "fade": "hardware"}
+
+# What the display is drawn on: 'rgbmatrix' for the LED Matrix, 'memory' to keep it in memory, 'png' to save each
+# frame to DisplayFramesDirectory, or 'terminal' to draw it in an ANSI terminal
+DisplayBackend = 'rgbmatrix'
+DisplayFramesDirectory = '/tmp/piclock-frames'
+
+# Frame timing statistics. They are written to RenderStatsFile every RenderStatsInterval seconds, and served to
+# anything connecting to RenderStatsSocket. Both are off (None) unless set. The clock usually runs as root, so put them
+# in a directory only it can write to, e.g. '/run/piclock/renderstats.json' and '/run/piclock/renderstats.sock', never
+# a shared one such as /tmp
+RenderStatsFile = None
+RenderStatsInterval = 60
+RenderStatsSocket = None
 
 # A dictionary with the location of the canvases. The None will be filled in by the object names before use
 CanvasPositions = {"Time": [(0, 0), None],
@@ -1,9 +1,22 @@
+import os
+
 # -----------------------------------------------------------------------------
 # OpenWeatherMap details
 # -----------------------------------------------------------------------------
+# Where the forecast is read from: 'openweathermap', or 'replay' to replay the recorded forecasts in WeatherReplayFiles
+# in turn rather than using the network
+WeatherProvider = 'openweathermap'
+WeatherReplayFiles = (os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchdata', 'owm_forecast.json'),)
+
 CityLocation = 2639964  # Potton
 WeatherUnits = 'imperial'
 WeatherURLFormat = 'http://api.openweathermap.org/data/2.5/forecast?id={}&APPID={}'
 OpenWeatherMapKey = 'XXXXXX'
 SecondsBetweenWeatherRefresh = 3600
 SecondsBetweemWeatherRefreshOnError = 60
+
+# Each forecast read is saved in WeatherCacheDirectory, and shown as soon as the clock starts if it is no more than
+# WeatherCacheMaxAge seconds old. Clocks on the same computer using the same directory share the forecasts, so each is
+# only read once. Set WeatherCacheDirectory to None to turn it off
+WeatherCacheDirectory = '/var/tmp/piclock-forecasts'
+WeatherCacheMaxAge = 12 * 60 * 60
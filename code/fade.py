@@ -0,0 +1,68 @@
+from PIL import Image
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class FadeEngine:
+    """
+    Produces the frames used to fade the display in or out without changing the frame being faded.
+    The fade is either done by the matrix itself, by changing its brightness, or by scaling every pixel through a
+    look up table made once for each fade level
+    """
+
+    def __init__(self, levels, usehardware):
+        """
+        :param levels: The number of steps between off (0) and fully on (levels)
+        :param usehardware: Fade using the matrix brightness rather than by scaling the pixels
+        """
+        self.__levels = levels
+        self.__usehardware = usehardware
+
+        # One 256 entry table per level, repeated for each of the R, G and B bands as Image.point expects
+        self.__luts = [[value * level // levels for value in range(256)] * 3 for level in range(levels + 1)]
+        if numpy is not None:
+            self.__arrayluts = [numpy.array(lut[:256], dtype=numpy.uint8) for lut in self.__luts]
+        self.__fadepixels = None
+        self.__fadeimage = None
+
+    @property
+    def levels(self):
+        return self.__levels
+
+    @property
+    def usehardware(self):
+        return self.__usehardware
+
+    def brightness(self, level):
+        """
+        The matrix brightness (0-100) for a fade level
+
+        :param level:
+        :return:
+        """
+        return 100 * level // self.__levels
+
+    def scaled_image(self, canvas, level):
+        """
+        Returns the canvas scaled to a fade level through the look up table. The canvas itself is not changed
+
+        :param canvas: A Canvas or NumpyCanvas
+        :param level: 0 (off) to levels (unchanged)
+        :return: An RGB image, which is only valid until the next call
+        """
+        if level >= self.__levels:
+            return canvas.Image
+
+        if numpy is not None and hasattr(canvas, 'pixels'):
+            pixels = canvas.pixels
+            if self.__fadepixels is None or self.__fadepixels.shape != pixels.shape:
+                self.__fadepixels = numpy.empty_like(pixels)
+                self.__fadeimage = Image.new('RGB', (pixels.shape[1], pixels.shape[0]))
+            numpy.take(self.__arrayluts[level], pixels, out=self.__fadepixels)
+            self.__fadeimage.frombytes(self.__fadepixels)
+            return self.__fadeimage
+
+        return canvas.Image.point(self.__luts[level])
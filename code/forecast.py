@@ -0,0 +1,165 @@
+import math
+from bisect import bisect_right
+from time import gmtime
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# The seconds each forecast in the OpenWeatherMap 5 day forecast covers
+FORECAST_SLOT_SECONDS = 3 * 60 * 60
+
+# The highest wind speed in m/s of each Beaufort number from 1 to 11. Anything faster is 12
+BEAUFORT_LIMITS = (2.0, 3.0, 5.0, 8.0, 11.0, 14.0, 17.0, 21.0, 24.0, 28.0, 32.0)
+
+
+class ForecastSlot:
+    """
+    The forecast for one slot, holding only what the Weather draws, already converted into the form it is drawn in.
+    Each weather provider decodes its own forecasts into these. Slots are shared by every Weather, so must not be
+    changed
+    """
+    __slots__ = ('starttime', 'maxtemp', 'mintemp', 'rain', 'snow', 'beaufort', 'icon', 'weathertime')
+
+    def __init__(self, starttime, maxtemp, mintemp, rain, snow, beaufort, icon):
+        """
+        :param starttime: The time the slot starts, in seconds since the epoch
+        :param maxtemp: The maximum temperature in Celsius, to 0.1 degrees
+        :param mintemp: The minimum temperature in Celsius, to 0.1 degrees
+        :param rain: The rain in mm, to the nearest 0.5mm up to 8mm
+        :param snow: The snow in mm, to the nearest 1mm up to 16mm, or -1 if none is forecast
+        :param beaufort: The wind speed on the Beaufort scale
+        :param icon: The name of the weather icon, e.g. '01d'
+        """
+        self.starttime = starttime
+        self.maxtemp = maxtemp
+        self.mintemp = mintemp
+        self.rain = rain
+        self.snow = snow
+        self.beaufort = beaufort
+        self.icon = icon
+        # The hour the slot starts (in UTC, so always a multiple of 3), for the time indicator
+        self.weathertime = gmtime(starttime).tm_hour
+
+
+class ForecastTable:
+    """
+    Every slot of one forecast, sorted by the time each starts. A new table is made for each forecast read, and
+    replaces the last one as a whole, so a reader always sees a complete forecast
+    """
+    __slots__ = ('starttimes', 'slots')
+
+    def __init__(self, slots):
+        """
+        :param slots: The ForecastSlots
+        """
+        slots = tuple(sorted(slots, key=lambda slot: slot.starttime))
+        self.starttimes = tuple(slot.starttime for slot in slots)
+        self.slots = slots
+
+    def find(self, forecasttime):
+        """
+        Returns the slot covering a time. If that slot has already gone from the forecast (it is dropped shortly before
+        it ends), the next slot is returned instead
+
+        :param forecasttime: The time, in seconds since the epoch
+        :return: The ForecastSlot, or None if there is none for that time
+        """
+        slot = bisect_right(self.starttimes, forecasttime) - 1
+        if slot >= 0 and forecasttime < self.starttimes[slot] + FORECAST_SLOT_SECONDS:
+            return self.slots[slot]
+        if slot + 1 < len(self.slots) and self.starttimes[slot + 1] - forecasttime <= FORECAST_SLOT_SECONDS:
+            return self.slots[slot + 1]
+        return None
+
+    def __len__(self):
+        return len(self.slots)
+
+
+def derive_slots(starttimes, maxkelvins, minkelvins, rains, snows, windspeeds, icons):
+    """
+    Converts every slot of a forecast at once into the form the Weather draws, as each provider's decode_slot does for
+    one slot. Each argument has one entry per slot. Uses NumPy if it is installed, so the conversions are done as array
+    arithmetic rather than slot by slot
+
+    :param starttimes: The times the slots start, in seconds since the epoch
+    :param maxkelvins: The maximum temperatures in Kelvin
+    :param minkelvins: The minimum temperatures in Kelvin
+    :param rains: The rain in mm
+    :param snows: The snow in mm, or -1 if none is forecast
+    :param windspeeds: The wind speeds in m/s
+    :param icons: The names of the weather icons
+    :return: A list of ForecastSlots
+    :raises TypeError, ValueError: If a value isn't a number
+    """
+    if numpy is None:
+        return [ForecastSlot(int(starttime), kelvin_to_celsius(maxkelvin), kelvin_to_celsius(minkelvin),
+                             min(8.0, math.ceil(float(rain) * 2) / 2.0),
+                             -1 if snow < 0 else min(16, int(math.ceil(float(snow)))),
+                             windspeed_to_beaufort(float(windspeed)), icon)
+                for starttime, maxkelvin, minkelvin, rain, snow, windspeed, icon
+                in zip(starttimes, maxkelvins, minkelvins, rains, snows, windspeeds, icons)]
+
+    # NumPy reads a missing value (None) as NaN, where float() would fail
+    values = numpy.array((maxkelvins, minkelvins, rains, snows, windspeeds), dtype=float)
+    if not numpy.isfinite(values).all():
+        raise ValueError('A forecast value is not a number')
+    maxkelvins, minkelvins, rains, snows, windspeeds = values
+
+    maxtemps = numpy.round(maxkelvins - 273.15, 1)
+    mintemps = numpy.round(minkelvins - 273.15, 1)
+    # Rain to the nearest 0.5mm up to 8mm, and snow to the nearest 1mm up to 16mm
+    rains = numpy.minimum(8.0, numpy.ceil(rains * 2) / 2.0)
+    snows = numpy.where(snows < 0, -1, numpy.minimum(16, numpy.ceil(snows))).astype(int)
+    beauforts = numpy.digitize(windspeeds, BEAUFORT_LIMITS, right=True) + 1
+
+    return [ForecastSlot(*slot) for slot in zip(map(int, starttimes), maxtemps.tolist(), mintemps.tolist(),
+                                                rains.tolist(), snows.tolist(), beauforts.tolist(), icons)]
+
+
+def kelvin_to_celsius(kelvin):
+    """
+    Converts the temperature from Kelvins to Celsius
+
+    :param kelvin:
+    :return: The temperature in Celsius
+    """
+    return round(float(kelvin) - 273.15, 1)
+
+
+def windspeed_to_beaufort(windspeedmps):
+    """
+    Converts the wind speed from m/s to Beaufort scale
+
+    :param windspeedmps:
+    :return:
+    """
+    beaufort = 0
+
+    if windspeedmps <= 2.0:
+        beaufort = 1
+    elif windspeedmps <= 3.0:
+        beaufort = 2
+    elif windspeedmps <= 5.0:
+        beaufort = 3
+    elif windspeedmps <= 8.0:
+        beaufort = 4
+    elif windspeedmps <= 11.0:
+        beaufort = 5
+    elif windspeedmps <= 14.0:
+        beaufort = 6
+    elif windspeedmps <= 17.0:
+        beaufort = 7
+    elif windspeedmps <= 21.0:
+        beaufort = 8
+    elif windspeedmps <= 24.0:
+        beaufort = 9
+    elif windspeedmps <= 28.0:
+        beaufort = 10
+    elif windspeedmps <= 32.0:
+        beaufort = 11
+    elif windspeedmps > 32.0:
+        beaufort = 12
+
+    return beaufort
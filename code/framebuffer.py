@@ -0,0 +1,155 @@
+import threading
+
+from PIL import Image
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from canvas import Canvas, MAX_DAMAGE_REGIONS, bounding_box
+from config_images import GalleryAtlas
+
+
+class NumpyCanvas:
+    """
+    A canvas with the same interface as Canvas, but whose pixels are held in a contiguous NumPy array
+    (height x width x 3) so images are drawn by slice assignment rather than by creating new images
+    """
+
+    def __init__(self, x, y):
+        """ Create a new canvas of size (x, y) """
+        self.__canvassize_x, self.__canvassize_y = x, y
+        self.__pixels = numpy.zeros((y, x, 3), dtype=numpy.uint8)
+
+        # An image kept in step with the array when it is asked for, so handing the canvas to PIL or SetImage does
+        # not create a new image every frame. It is created the first time it is needed
+        self.__image = None
+        self.__imagestale = False
+
+        self.__damage = []
+        self.__damagelock = threading.Lock()
+
+    @property
+    def get_canvassize_x(self):
+        return self.__canvassize_x
+
+    @property
+    def get_canvassize_y(self):
+        return self.__canvassize_y
+
+    @property
+    def pixels(self):
+        """ The array holding the canvas pixels """
+        return self.__pixels
+
+    def draw_on_canvas(self, imagedata, whichimage):
+        """
+        Draws an image on the canvas
+
+        :param imagedata: A tuple containing: (X position, Y position, ImageGalery, ImageGaleryPositions)
+        :param whichimage: The sub-image contained in the ImageGalery
+        """
+        tile = GalleryAtlas.get_tile(imagedata[2], imagedata[3], whichimage, asarray=True)
+        self.__blit(tile, imagedata[0], imagedata[1])
+
+    def crop(self, imagebox):
+        return self.Image.crop(imagebox)
+
+    def copy_from(self, canvas, imagebox, position):
+        """
+        Copies a region of another canvas onto this canvas
+
+        :param canvas: The canvas to copy from
+        :param imagebox: The (left, top, right, bottom) region of canvas to copy
+        :param position: The (x, y) position on this canvas to copy it to
+        """
+        if isinstance(canvas, NumpyCanvas):
+            self.__blit(canvas.pixels[imagebox[1]:imagebox[3], imagebox[0]:imagebox[2]], position[0], position[1])
+        else:
+            self.paste(canvas.crop(imagebox), position)
+
+    def tobytes(self):
+        """ Returns the pixels of the canvas as RGB bytes """
+        return self.__pixels.tobytes()
+
+    def copy(self):
+        """ Returns a new canvas holding a copy of this canvas's pixels, with no damage """
+        copied = NumpyCanvas(self.__canvassize_x, self.__canvassize_y)
+        copied.__pixels[:] = self.__pixels
+        copied.__imagestale = True
+        return copied
+
+    def paste(self, imagetopaste, position):
+        """
+        Pastes an image or an RGB array onto the canvas
+
+        :param imagetopaste: A PIL image or a (height x width x 3) uint8 array
+        :param position: The (x, y) position of the top left of the image
+        """
+        if not isinstance(imagetopaste, numpy.ndarray):
+            if imagetopaste.mode != 'RGB':
+                imagetopaste = imagetopaste.convert('RGB')
+            imagetopaste = numpy.asarray(imagetopaste)
+        self.__blit(imagetopaste, position[0], position[1])
+
+    def take_damage(self):
+        """
+        Returns the regions drawn on since the last call, and forgets them
+
+        :return: A list of (left, top, right, bottom) boxes, right and bottom exclusive
+        """
+        with self.__damagelock:
+            damage = self.__damage
+            self.__damage = []
+        return damage
+
+    @property
+    def Image(self):
+        """
+        Returns the canvas as an RGB image. PIL has no RGB layout that can share the array's memory, so the pixels
+        are copied into the same image each time the canvas has changed. The image is only valid until the canvas is
+        next drawn on
+        """
+        if self.__image is None:
+            self.__image = Image.frombytes('RGB', (self.__canvassize_x, self.__canvassize_y), self.__pixels.tobytes())
+            self.__imagestale = False
+        elif self.__imagestale:
+            self.__image.frombytes(self.__pixels)
+            self.__imagestale = False
+        return self.__image
+
+    def __blit(self, tile, x, y):
+        """
+        Copies an array onto the canvas at (x, y), clipping it to the canvas
+
+        :param tile: A (height x width x 3) uint8 array
+        :param x:
+        :param y:
+        """
+        left, top = max(x, 0), max(y, 0)
+        right = min(x + tile.shape[1], self.__canvassize_x)
+        bottom = min(y + tile.shape[0], self.__canvassize_y)
+
+        # If the image is off the canvas, don't draw any of it
+        if left < right and top < bottom:
+            self.__pixels[top:bottom, left:right] = tile[top - y:bottom - y, left - x:right - x]
+            self.__imagestale = True
+            with self.__damagelock:
+                self.__damage.append((left, top, right, bottom))
+                if len(self.__damage) > MAX_DAMAGE_REGIONS:
+                    self.__damage = [bounding_box(self.__damage)]
+
+
+def create_framebuffer(x, y, backend):
+    """
+    Creates the canvas the display is composed on
+
+    :param x:
+    :param y:
+    :param backend: 'numpy' for a NumpyCanvas, or 'pil' for a Canvas. A Canvas is used if NumPy is not installed
+    :return: The canvas
+    """
+    if backend == 'numpy' and numpy is not None:
+        return NumpyCanvas(x, y)
+    return Canvas(x, y)
@@ -1,76 +1,485 @@
+import fcntl
+import hashlib
+import json
+import os
+import random
+import tempfile
 import threading
-from datetime import datetime, timedelta
-from time import sleep
+from time import sleep, time, perf_counter
 
-from requests import get
+from requests import Session
+
+from forecast import FORECAST_SLOT_SECONDS
+from renderstats import Histogram
+
+# The seconds to wait for the connection to the weather provider, and then between the bytes of the forecast, before
+# the read is given up as an error
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+
+# The location the Weather widgets show unless they are given another
+DEFAULT_LOCATION = 'default'
+
+# The fewest seconds between reading one forecast and the next, so several locations aren't all read at once
+FETCH_SPACING = 2
+
+
+class ForecastSource:
+    """
+    A forecast read by GetWeatherData. Locations whose providers make the same request share one ForecastSource, so it
+    is only read once however many of them there are
+    """
+    __slots__ = ('provider', 'cachefile', 'forecasts', 'validators', 'fetched', 'nextfetch', 'consecutiveerrors')
+
+    def __init__(self, provider, cachefile, nextfetch):
+        """
+        :param provider: The weather provider
+        :param cachefile: The file the forecast is saved to and shared through, or None
+        :param nextfetch: The time to first read it
+        """
+        self.provider = provider
+        self.cachefile = cachefile
+        # The ForecastTable last read, or None. It is only ever replaced as a whole
+        self.forecasts = None
+        # The validators from the last forecast read are sent with the next read, so the server can answer 304 Not
+        # Modified instead of sending the same forecast again
+        self.validators = {}
+        # The time the forecast held was read, by this clock or another sharing the cache
+        self.fetched = 0
+        self.nextfetch = nextfetch
+        self.consecutiveerrors = 0
+
+    @property
+    def url(self):
+        """ The URL the forecast is read from, or None if the provider doesn't read it over HTTP """
+        return self.provider.url
+
+    @property
+    def conditional_headers(self):
+        """ Returns the headers asking for the forecast only if it has changed since the last one read """
+        headers = {}
+        if 'ETag' in self.validators:
+            headers['If-None-Match'] = self.validators['ETag']
+        if 'Last-Modified' in self.validators:
+            headers['If-Modified-Since'] = self.validators['Last-Modified']
+        return headers
 
 
 class GetWeatherData(threading.Thread):
-    def __init__(self, mapkey, weatherformat, cityid, units, frequency, errorfrequency):
+    def __init__(self, provider, frequency, errorfrequency, cachedirectory=None, cachemaxage=None):
         """
-        Retrieves the weather from OpenWeatherMap.org at the defined frequency and stored in __wetherdatadict
+        Retrieves the weather for one or more locations at the defined frequency. Locations asking for the same forecast
+        share one read, the reads are spaced out rather than made all at once, and every forecast read is saved in
+        cachedirectory, where other clocks using the same directory read it rather than asking for it again
 
-        :param mapkey: The OpenWeatherMap key
-        :param weatherformat:
-        :param cityid:
-        :param units:
+        :param provider: The weather provider (see weatherprovider) for DEFAULT_LOCATION, or None to add every location
+                         with add_location
         :param frequency:
         :param errorfrequency:
+        :param cachedirectory: The directory each forecast read is saved to, so it can be shown straight away after a
+                               restart and shared with other clocks, or None to not save them
+        :param cachemaxage: The oldest (in seconds) a saved forecast can be and still be shown, or None for any age
         """
-        self.__mapkey = mapkey
-        self.__weatherURLFormat = weatherformat
-        self.__cityid = cityid
-        self.__units = units
         self.__refreshfrequency = frequency
         self.__errorfrequency = errorfrequency
+        self.__cachedirectory = cachedirectory
+        self.__cachemaxage = cachemaxage
+        if cachedirectory is not None:
+            try:
+                os.makedirs(cachedirectory, exist_ok=True)
+            except OSError:
+                print('Error creating the forecast cache {}'.format(cachedirectory))
+                self.__cachedirectory = None
+
+        # Each location's ForecastSource, and the sources by the request their provider makes
+        self.__locations = {}
+        self.__sources = {}
+
+        # The version goes up each time a forecast is stored or a forecast slot ends, and the subscribers are told
+        self.__version = 0
+        self.__updated = threading.Condition()
+        self.__subscribers = []
+        self.__slot = int(time()) // FORECAST_SLOT_SECONDS
+
+        # The connection is kept open between reads
+        self.__session = None
+
+        self.__latency = Histogram()
+        self.__fetches = 0
+        self.__notmodified = 0
+        self.__errors = 0
+        self.__sharedreads = 0
+        self.__wirebytes = 0
+        self.__decodedbytes = 0
+        self.__cacheage = None
 
-        self.__wetherdatadict = []
+        if provider is not None:
+            self.add_location(DEFAULT_LOCATION, provider)
 
         super(GetWeatherData, self).__init__()
 
+    def add_location(self, location, provider):
+        """
+        Adds a location to read the forecast for. It must be added before the thread is started
+
+        :param location: The name the Weather widgets use for the location
+        :param provider: The weather provider for the location. If another location's provider makes the same request
+                         (e.g. for the same city), the forecast is only read once for both
+        """
+        source = self.__sources.get(provider.key)
+        if source is None:
+            cachefile = None
+            if self.__cachedirectory is not None:
+                cachefile = os.path.join(self.__cachedirectory, 'forecast-{}.json'.format(
+                    hashlib.sha1(provider.key.encode()).hexdigest()[:16]))
+            # Space out the first reads as well
+            source = ForecastSource(provider, cachefile, time() + len(self.__sources) * FETCH_SPACING)
+            self.__sources[provider.key] = source
+        self.__locations[location] = source
+
     def run(self):
-        """ Method runs as a thread, retrieving the weather from OpenWeatherMap.org """
+        """ Method runs as a thread, retrieving the weather from the providers """
         while True:
-            sleeptime = self.__refreshfrequency
+            sleep(self.step())
+
+    def step(self):
+        """
+        Retrieves the forecast which is due next, if it is due, and tells the subscribers if a forecast slot has ended
+
+        :return: The seconds until the next forecast should be retrieved or the next slot ends
+        """
+        self.check_slot_boundary()
+        source, wait = self.next_fetch()
+        if source is None:
+            wait = self.__refreshfrequency
+        elif wait <= 0:
+            self.fetch(source)
+            wait = max(self.next_fetch()[1], FETCH_SPACING)
+        return min(wait, self.seconds_to_slot_boundary())
+
+    def next_fetch(self):
+        """
+        Returns the forecast to read next
+
+        :return: (ForecastSource, seconds until it is due), or (None, None) if there are no locations
+        """
+        if not self.__sources:
+            return None, None
+        source = min(self.__sources.values(), key=lambda candidate: candidate.nextfetch)
+        return source, max(source.nextfetch - time(), 0)
+
+    def fetch(self, source):
+        """
+        Reads a forecast with requests. Only one clock sharing the cache reads it at a time, and if another has read it
+        since this one last did, that is used instead
+
+        :param source: The ForecastSource
+        """
+        if self.__session is None:
+            self.__session = Session()
+            self.__session.headers.update({'Accept-Encoding': 'gzip, deflate'})
+
+        lockfile = self.lock_cache(source)
+        try:
+            if self.read_shared(source):
+                return
+            fetchstart = perf_counter()
             try:
-                weatherdata = get(self.__weatherURLFormat.format(self.__cityid, self.__mapkey),
-                                  headers={'Connection': 'close'})
-                if weatherdata.status_code == 200:
-                    self.__wetherdatadict = weatherdata.json()
-            except:
-                sleeptime = self.__errorfrequency
-            finally:
-                sleep(sleeptime)
+                status, headers, forecasts, wirebytes, decodedbytes = source.provider.fetch(
+                    self.__session, source.conditional_headers, (CONNECT_TIMEOUT, READ_TIMEOUT))
+                self.fetched(source, status, headers, forecasts, perf_counter() - fetchstart, wirebytes,
+                             decodedbytes)
+            except Exception:
+                self.failed(source, perf_counter() - fetchstart)
+        finally:
+            self.unlock_cache(lockfile)
+
+    def fetched(self, source, status, headers, forecasts, latency, wirebytes, decodedbytes):
+        """
+        Records a response from the provider, storing the forecasts if there are new ones. If a new forecast can't be
+        decoded the exception is raised before anything is recorded, for the caller to count as a failed read
+
+        :param source: The ForecastSource read
+        :param status: The HTTP status code
+        :param headers: The response headers
+        :param forecasts: The forecast JSON as a dictionary if the status is 200, otherwise None
+        :param latency: The seconds the read took
+        :param wirebytes: The bytes received, as sent (e.g. compressed)
+        :param decodedbytes: The bytes of the decompressed response
+        """
+        if status not in (200, 304):
+            self.failed(source, latency)
+            return
+        # Decode it before anything is recorded, so a forecast which can't be decoded only counts as an error, and its
+        # validators aren't kept (which would stop it ever being read again)
+        table = source.provider.decode(forecasts) if status == 200 else None
+
+        self.__fetches += 1
+        self.__latency.record(latency)
+        self.__wirebytes += wirebytes or 0
+        self.__decodedbytes += decodedbytes or 0
+        source.consecutiveerrors = 0
+        source.fetched = time()
+        source.nextfetch = source.fetched + self.__refreshfrequency
+        if status == 304:
+            self.__notmodified += 1
+            forecasts = self.__read_cache(source)
+            forecasts = forecasts['forecast'] if forecasts is not None else None
+        else:
+            source.validators = {name: headers[name] for name in ('ETag', 'Last-Modified') if name in headers}
+            source.forecasts = table
+            self.__publish()
+        # Save it again after a 304 too, so other clocks sharing the cache know it is still current
+        if forecasts is not None:
+            self.__save_cache(source, forecasts)
+
+    def failed(self, source, latency):
+        """
+        Records a read which failed. Each failure in a row doubles the wait before the next read, from errorfrequency
+        up to refreshfrequency, and the wait is jittered so readers which failed together don't retry together
+
+        :param source: The ForecastSource which couldn't be read
+        :param latency: The seconds until the read failed
+        """
+        self.__errors += 1
+        self.__latency.record(latency)
+        backoff = min(self.__errorfrequency * 2 ** source.consecutiveerrors,
+                      max(self.__refreshfrequency, self.__errorfrequency))
+        source.consecutiveerrors += 1
+        source.nextfetch = time() + random.uniform(backoff / 2, backoff)
+
+    def read_shared(self, source):
+        """
+        Uses the forecast saved by another clock sharing the cache, if it has been read since this clock last read it
+        and is not yet due to be read again
+
+        :param source: The ForecastSource
+        :return: True if the saved forecast was used, so there is no need to read it
+        """
+        cached = self.__read_cache(source)
+        if (cached is None or cached['fetched'] <= source.fetched or
+                time() - cached['fetched'] >= self.__refreshfrequency):
+            return False
+        self.__set_source_forecasts(source, cached['forecast'])
+        source.validators = cached['validators']
+        source.fetched = cached['fetched']
+        source.consecutiveerrors = 0
+        # Jittered, so the clocks sharing the cache don't all find it due at the same moment
+        source.nextfetch = source.fetched + self.__refreshfrequency + random.uniform(0, FETCH_SPACING)
+        self.__sharedreads += 1
+        return True
 
-    def get_weatherforecast(self, offsethours):
+    def load_cache(self):
         """
-        Reads the weather forecast for the time weather_forecast_time from __weatherdatadict
+        Shows the forecasts saved by the last read, where they are not older than cachemaxage. The forecasts are still
+        read as usual, and replace the saved ones when they arrive
+
+        :return: True if a saved forecast was loaded for every location
+        """
+        for source in self.__sources.values():
+            cached = self.__read_cache(source)
+            if cached is None:
+                continue
+            age = time() - cached['fetched']
+            if self.__cachemaxage is not None and age > self.__cachemaxage:
+                continue
+            self.__set_source_forecasts(source, cached['forecast'])
+            source.validators = cached['validators']
+            source.fetched = cached['fetched']
+            self.__cacheage = max(self.__cacheage or 0, round(age))
+        return bool(self.__sources) and all(source.forecasts is not None for source in self.__sources.values())
+
+    @staticmethod
+    def __read_cache(source):
+        """
+        Reads the forecast saved for a source
+
+        :param source: The ForecastSource
+        :return: The saved dictionary of 'fetched', 'validators' and 'forecast', or None if there isn't one
+        """
+        if source.cachefile is None:
+            return None
+        try:
+            with open(source.cachefile) as cachefile:
+                cached = json.load(cachefile)
+            # Anything else was not saved by this clock, and could stop the forecast being decoded
+            if (isinstance(cached['fetched'], (int, float)) and isinstance(cached['validators'], dict) and
+                    isinstance(cached['forecast'], dict) and isinstance(cached['forecast'].get('list', []), list)):
+                return cached
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    @staticmethod
+    def __save_cache(source, forecasts):
+        """
+        Saves a forecast which has been read, with the time it was read. It is written to a temporary file first, so
+        a restart (or power cut) part way through never leaves half a forecast
+
+        :param source: The ForecastSource
+        :param forecasts: The forecast JSON, as a dictionary
+        """
+        if source.cachefile is None:
+            return
+        # A name no one else can have made (the cache directory can be shared), so it can't be a planted link
+        directory, name = os.path.split(source.cachefile)
+        try:
+            descriptor, temporaryfile = tempfile.mkstemp(prefix=name + '.', suffix='.tmp', dir=directory or '.')
+        except OSError:
+            print('Error saving the forecast to {}'.format(source.cachefile))
+            return
+        try:
+            with os.fdopen(descriptor, 'w') as cachefile:
+                json.dump({'fetched': source.fetched, 'validators': source.validators, 'forecast': forecasts},
+                          cachefile)
+                cachefile.flush()
+                os.fsync(cachefile.fileno())
+            # Other clocks sharing the cache may run as other users, and mkstemp only lets the owner read it
+            os.chmod(temporaryfile, 0o644)
+            os.replace(temporaryfile, source.cachefile)
+        except (OSError, TypeError, ValueError):
+            print('Error saving the forecast to {}'.format(source.cachefile))
+            os.remove(temporaryfile)
+
+    @staticmethod
+    def lock_cache(source):
+        """
+        Takes the cache lock for a source, so only one of the clocks sharing the cache reads the forecast at a time.
+        Waits while another clock holds it, so must not be called from an event loop
+
+        :param source: The ForecastSource
+        :return: The lock, to pass to unlock_cache, or None if there is no cache to lock
+        """
+        if source.cachefile is None:
+            return None
+        try:
+            lockfile = open(source.cachefile + '.lock', 'a')
+        except OSError:
+            return None
+        try:
+            fcntl.flock(lockfile, fcntl.LOCK_EX)
+        except OSError:
+            lockfile.close()
+            return None
+        return lockfile
+
+    @staticmethod
+    def unlock_cache(lockfile):
         """
-        weather = None
-        weatherlist = self.__wetherdatadict['list']
-        offsettime = self.__get_offset_date(offsethours)
+        Releases a cache lock taken with lock_cache
 
-        foundweather = next((sub for sub in weatherlist if sub['dt_txt'] == offsettime), None)
-        if foundweather is not None:
-            weather = foundweather
+        :param lockfile: The lock, or None
+        """
+        if lockfile is not None:
+            fcntl.flock(lockfile, fcntl.LOCK_UN)
+            lockfile.close()
 
-        return weather
+    @property
+    def fetchstats(self):
+        """
+        Returns the number of reads (including those shared from other clocks), their latency, the bytes transferred
+        and the age of the oldest forecast loaded from the cache at startup (None if there wasn't one) as a dictionary
+        """
+        return {'version': self.__version,
+                'locations': len(self.__locations),
+                'forecasts': len(self.__sources),
+                'fetches': self.__fetches,
+                'notmodified': self.__notmodified,
+                'sharedreads': self.__sharedreads,
+                'errors': self.__errors,
+                'consecutiveerrors': max((source.consecutiveerrors for source in self.__sources.values()), default=0),
+                'wirebytes': self.__wirebytes,
+                'decodedbytes': self.__decodedbytes,
+                'cacheage': self.__cacheage,
+                'latency': self.__latency.snapshot}
 
     @property
-    def haveforecasts(self):
-        return self.__wetherdatadict != []
+    def refreshfrequency(self):
+        return self.__refreshfrequency
+
+    @property
+    def errorfrequency(self):
+        return self.__errorfrequency
+
+    def set_forecasts(self, forecasts, location=DEFAULT_LOCATION):
+        """
+        Stores forecasts which have been read. They are decoded once here for every Weather, and the JSON is not kept
+
+        :param forecasts: The forecast as read by the provider, e.g. the OpenWeatherMap JSON as a dictionary
+        :param location: The location it is the forecast for
+        """
+        self.__set_source_forecasts(self.__locations[location], forecasts)
+
+    def __set_source_forecasts(self, source, forecasts):
+        source.forecasts = source.provider.decode(forecasts)
+        self.__publish()
+
+    def subscribe(self, callback):
+        """
+        Asks to be told whenever there is a new forecast, or a forecast slot ends so 'now' is in the next slot
+
+        :param callback: Called with the new version from the thread storing the forecast or seeing the slot end, so
+                         it must be quick and thread safe, e.g. waking a widget
+        """
+        self.__subscribers.append(callback)
+
+    @property
+    def version(self):
+        """ Goes up each time there is a new forecast or a forecast slot ends """
+        return self.__version
+
+    def wait_for_update(self, version, timeout=None):
+        """
+        Waits until there is a new forecast or a forecast slot ends
+
+        :param version: The version the caller has seen
+        :param timeout: The most seconds to wait, or None to wait for as long as it takes
+        :return: The version now
+        """
+        with self.__updated:
+            self.__updated.wait_for(lambda: self.__version != version, timeout)
+            return self.__version
+
+    def check_slot_boundary(self):
+        """ Tells the subscribers if a forecast slot has ended since the last check """
+        slot = int(time()) // FORECAST_SLOT_SECONDS
+        if slot != self.__slot:
+            self.__slot = slot
+            self.__publish()
 
     @staticmethod
-    def __get_offset_date(offset):
+    def seconds_to_slot_boundary():
+        """ Returns the seconds until the current forecast slot ends """
+        return FORECAST_SLOT_SECONDS - time() % FORECAST_SLOT_SECONDS
+
+    def __publish(self):
+        """ Moves to the next version and tells everyone waiting for it """
+        with self.__updated:
+            self.__version += 1
+            version = self.__version
+            self.__updated.notify_all()
+        for callback in self.__subscribers:
+            callback(version)
+
+    def get_weatherforecast(self, offsethours, location=DEFAULT_LOCATION):
         """
-        Calculate the date for the forecast (offset hours from now)
+        Returns the forecast for offsethours from now. If the slot covering that time has already gone from the forecast
+        (it is dropped shortly before it ends), the next slot is returned instead
 
-        :param offset:
-        :return:
+        :param offsethours: The hours from now
+        :param location: The location to forecast
+        :return: The ForecastSlot, or None if there is none for that time
         """
-        forecastdate = datetime.now() + timedelta(hours=offset)
-        forecasthour = int(forecastdate.strftime('%H'))
-        forecastseachhour = forecasthour - forecasthour % 3
-        returndate = forecastdate.strftime('%Y') + '-' + forecastdate.strftime('%m') + '-' + forecastdate.strftime(
-            '%d') + ' ' + '{:02}'.format(forecastseachhour) + ':00:00'
-        return returndate
+        source = self.__locations.get(location)
+        if source is None or source.forecasts is None:
+            return None
+        return source.forecasts.find(time() + offsethours * 60 * 60)
+
+    def has_forecasts(self, location=DEFAULT_LOCATION):
+        """ Returns True once there is a forecast for the location """
+        source = self.__locations.get(location)
+        return source is not None and source.forecasts is not None
+
+    @property
+    def haveforecasts(self):
+        return self.has_forecasts()
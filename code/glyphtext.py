@@ -0,0 +1,105 @@
+from PIL import Image
+
+from lrucache import LRUCache
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class TextRenderer:
+    """
+    Lays out strings of glyphs from an image gallery (e.g. the temperature font) side by side, and keeps the rendered
+    strings so drawing a string that has been drawn before is a single paste
+    """
+
+    def __init__(self, atlas, maxstrings):
+        """
+        :param atlas: The ImageAtlas the glyphs are taken from
+        :param maxstrings: The most rendered strings to keep. The least recently used are dropped
+        """
+        self.__atlas = atlas
+
+        self.__fonts = {}
+        self.__strings = LRUCache(maxstrings)
+
+    def draw(self, canvas, imagedata, glyphs):
+        """
+        Draws a string of glyphs on a canvas
+
+        :param canvas: The Canvas or NumpyCanvas to draw on
+        :param imagedata: A tuple containing: (X position, Y position, ImageGalery, ImageGaleryPositions)
+        :param glyphs: The sub-images to draw, left to right, e.g. ('max', 'ssp', '1', '2', '.', '3', 'C')
+        :return: The x position following the string
+        """
+        rendered = self.render(imagedata[2], imagedata[3], tuple(glyphs), hasattr(canvas, 'pixels'))
+        canvas.paste(rendered, (imagedata[0], imagedata[1]))
+        return imagedata[0] + self.width(imagedata[2], imagedata[3], glyphs)
+
+    def width(self, galleryimage, gallerypositions, glyphs):
+        """
+        Returns the width of a string of glyphs
+
+        :param galleryimage: A single image containing all the glyphs
+        :param gallerypositions: contains the locations of the glyphs in galleryimage
+        :param glyphs: The sub-images in the string
+        :return:
+        """
+        advances = self.__font(galleryimage, gallerypositions)[0]
+        return sum(advances[glyph] for glyph in glyphs)
+
+    def render(self, galleryimage, gallerypositions, glyphs, asarray=False):
+        """
+        Returns a string of glyphs as a single image, rendering it if it is not already kept
+
+        :param galleryimage: A single image containing all the glyphs
+        :param gallerypositions: contains the locations of the glyphs in galleryimage
+        :param glyphs: A tuple of the sub-images in the string
+        :param asarray: Return the string as an RGB NumPy array rather than an image
+        :return: An image or array, which must not be changed by the caller
+        """
+        # Several position tables can share one gallery image, so both identify the font
+        key = (id(galleryimage), id(gallerypositions), glyphs, asarray)
+        rendered = self.__strings.get(key)
+        if rendered is not None:
+            return rendered
+
+        advances, height = self.__font(galleryimage, gallerypositions)
+        rendered = Image.new('RGB', (sum(advances[glyph] for glyph in glyphs), height))
+        x = 0
+        for glyph in glyphs:
+            rendered.paste(self.__atlas.get_tile(galleryimage, gallerypositions, glyph), (x, 0))
+            x += advances[glyph]
+        if asarray:
+            rendered = numpy.asarray(rendered)
+
+        return self.__strings.put(key, rendered)
+
+    @property
+    def stats(self):
+        """ Returns a dictionary of the cache usage """
+        stats = self.__strings.stats
+        return {'strings': stats['entries'],
+                'maxstrings': stats['maxsize'],
+                'hits': stats['hits'],
+                'misses': stats['misses'],
+                'evictions': stats['evictions']}
+
+    def __font(self, galleryimage, gallerypositions):
+        """
+        Returns the advance width of every glyph in a gallery, and the height of the tallest, working them out the
+        first time the gallery is used
+
+        :param galleryimage:
+        :param gallerypositions:
+        :return: (dictionary of advance widths, height)
+        """
+        fontkey = (id(galleryimage), id(gallerypositions))
+        font = self.__fonts.get(fontkey)
+        if font is None:
+            advances = {glyph: box[2] - box[0] + 1 for glyph, box in gallerypositions.items()}
+            height = max(box[3] - box[1] + 1 for box in gallerypositions.values())
+            font = (advances, height)
+            self.__fonts[fontkey] = font
+        return font
@@ -1,9 +1,28 @@
 import threading
 import time
 
-from PIL import ImageEnhance
-from canvas import Canvas
-from rgbmatrix import RGBMatrix, RGBMatrixOptions
+from canvas import bounding_box
+from fade import FadeEngine
+from framebuffer import create_framebuffer
+from matrixbackend import create_rgbmatrix
+from notifier import ChangeNotifier
+from renderstats import RenderStats
+
+# The states of the display. It fades out once when there has been no movement, then stays off, with nothing composed
+# or drawn, until there is movement again
+DISPLAY_ON = 'on'
+DISPLAY_FADING = 'fading'
+DISPLAY_OFF = 'off'
+
+# The number of steps between off and fully on in a fade
+FADE_LEVELS = 10
+
+# The seconds between the steps of a fade. Fading in is quicker, so the clock appears as soon as someone walks in
+FADE_OUT_STEP = 0.1
+FADE_IN_STEP = 0.03
+
+# The seconds the widgets are given to redraw after being woken, before the display composes the frame it fades in
+WAKE_SETTLE = 0.05
 
 
 class LEDDisplay(threading.Thread):
@@ -13,31 +32,20 @@ class LEDDisplay(threading.Thread):
     required to be displayed correctly.
     """
 
-    def __init__(self, screendefinition, componentdefinition, pir):
+    def __init__(self, screendefinition, componentdefinition, pir, matrix=None, startuptimer=None, notifier=None):
         """
         Initialises the LED Matrix then updates it periodically if necessary
 
         :param screendefinition:
         :param componentdefinition:
         :param pir:
+        :param matrix: The matrix to draw on (see matrixbackend), or None for the rgbmatrix LED Matrix
+        :param startuptimer: A StartupTimer to tell when the first frame has been shown, or None
+        :param notifier: The notifier the components and PIR wake the display with, or None for a ChangeNotifier
         """
-        options = RGBMatrixOptions()
-
-        options.hardware_mapping = screendefinition['matrixDriver']
-        options.rows = screendefinition['matrixRows']
-        options.cols = screendefinition['matrixCols']
-        options.chain_length = screendefinition['matrixCount']
-        options.pixel_mapper_config = screendefinition['matrixMapper']
-
-        options.row_address_type = 0
-        options.multiplexing = 0
-        options.pwm_bits = 11
-        options.brightness = 100
-        options.pwm_lsb_nanoseconds = 130
-        options.led_rgb_sequence = "RGB"
-        options.show_refresh_rate = 0
-
-        self.__display = RGBMatrix(options=options)
+        if matrix is None:
+            matrix = create_rgbmatrix(screendefinition)
+        self.__display = matrix
         self.__display.Clear()
         self.__displaybuffer = self.__display.CreateFrameCanvas()
 
@@ -45,76 +53,233 @@ class LEDDisplay(threading.Thread):
         self.__displaysize_y = self.__display.height
 
         self.__drawdisplay = True
-        self.__displaycanvas = Canvas(self.__displaysize_x, self.__displaysize_y)
+        self.__displaycanvas = create_framebuffer(self.__displaysize_x, self.__displaysize_y,
+                                                  screendefinition.get('framebuffer', 'pil'))
 
         self.__screencomponents = componentdefinition
 
         self.__pirobject = pir
 
-        self.__redrawall = True
+        # The components and the PIR wake the display when they change, rather than the display polling them
+        self.__notifier = notifier if notifier is not None else ChangeNotifier()
+        for canvas in self.__screencomponents:
+            self.__screencomponents[canvas][1].set_notifier(self.__notifier)
+        self.__pirobject.set_notifier(self.__notifier)
+
+        # The generation of each component last drawn on the display canvas. A component is redrawn when it publishes
+        # a new generation, and only the regions which changed since this one are copied
+        self.__generations = {}
+
+        # The display is double buffered, so the buffer being drawn on is one frame behind the one being shown. The
+        # regions uploaded for the last frame are remembered so they can be brought up to date as well. Both buffers
+        # need the whole frame uploading at the start and after a fade
+        self.__lastuploaded = []
+        self.__fullframesneeded = 2
+        self.__lastframe = None
+
+        # Fade using the matrix brightness if asked to and the matrix supports it, otherwise scale the pixels
+        usehardware = screendefinition.get('fade', 'hardware') == 'hardware' and hasattr(self.__displaybuffer,
+                                                                                         'brightness')
+        self.__fader = FadeEngine(FADE_LEVELS, usehardware)
+        self.__state = DISPLAY_ON
+        self.__powerlisteners = []
+
+        self.__stats = RenderStats()
+        self.__startuptimer = startuptimer
 
         super(LEDDisplay, self).__init__()
 
     def run(self):
         while True:
-            if self.__pirobject.hasbeenmovement:
-                displaycanvasupdated = False
-                for canvas in self.__screencomponents:
-                    if self.__screencomponents[canvas][1].haschanged or self.__redrawall:
-                        subcanvasimage = self.__screencomponents[canvas][1].get_canvas
-                        self.__paste_to_displaycanvas(self.__screencomponents[canvas][0], subcanvasimage)
-                        displaycanvasupdated = True
-                if displaycanvasupdated:
-                    self.__updatedisplay()
-                    self.__redrawall = False
-            else:
-                self.__fade_matrix_canvas(10, 0, -1)
-                self.__redrawall = True
+            self.step()
+            self.__notifier.wait()
+
+    def step(self):
+        """
+        Copies the components which have changed to the display. When there has been no movement the display is faded
+        out and the widgets are paused, and when there is movement again they are woken and the display faded back in
+        """
+        movement = self.__pirobject.hasbeenmovement
+        if self.__state == DISPLAY_OFF:
+            if movement:
+                self.__wake()
+        elif not movement:
+            self.__sleep()
+        else:
+            framestart = time.perf_counter()
+            displaydamage = self.__compose()
+            self.__stats.record_stage('compose', time.perf_counter() - framestart)
+
+            if displaydamage and self.__updatedisplay(displaydamage):
+                self.__stats.record_stage('frame', time.perf_counter() - framestart)
+                if self.__startuptimer is not None:
+                    self.__startuptimer.milestone('firstframe')
+                    self.__startuptimer = None
+
+    def add_power_listener(self, listener):
+        """
+        Adds a function to call when the display turns off or on, e.g. to pause a scheduler. The notifier's widgets are
+        paused and woken without one
+
+        :param listener: Called with False once the display has faded out, and with True as it wakes
+        """
+        self.__powerlisteners.append(listener)
+
+    @property
+    def state(self):
+        """ Returns DISPLAY_ON, DISPLAY_FADING or DISPLAY_OFF """
+        return self.__state
+
+    @property
+    def stats(self):
+        """ Returns the frame timings and counts as a dictionary """
+        stats = self.__stats.snapshot
+        stats['state'] = self.__state
+        return stats
 
-            time.sleep(0.5)
+    def __compose(self):
+        """
+        Copies the regions of the components which have changed since they were last copied to the display canvas
+
+        :return: The regions of the display canvas changed
+        """
+        for canvas in self.__screencomponents:
+            component = self.__screencomponents[canvas][1]
+            snapshot, damage = component.changes_since(self.__generations.get(canvas))
+            if damage is None or damage:
+                self.__paste_to_displaycanvas(self.__screencomponents[canvas][0], snapshot.canvas, damage)
+                self.__stats.record_component(canvas)
+            self.__generations[canvas] = snapshot.generation
+        return self.__displaycanvas.take_damage()
 
-    def __fade_matrix_canvas(self, start, end, step):
+    def __sleep(self):
+        """ Fades the display out, then pauses the widgets until there is movement again """
+        self.__state = DISPLAY_FADING
+        self.__fade_matrix_canvas(self.__fader.levels, 0, -1, FADE_OUT_STEP)
+        self.__state = DISPLAY_OFF
+        self.__set_power(False)
+
+    def __wake(self):
+        """ Wakes the widgets, and fades in the frame they draw """
+        self.__state = DISPLAY_FADING
+        self.__set_power(True)
+        time.sleep(WAKE_SETTLE)
+        self.__compose()
+        self.__fade_matrix_canvas(0, self.__fader.levels, 1, FADE_IN_STEP)
+        self.__state = DISPLAY_ON
+
+    def __set_power(self, displayon):
         """
-        Fade the Matrix canvas between states 'on' and 'off'
+        Tells the widgets, and anything else listening, the display has turned off or on
 
-        :param start:
-        :param end:
-        :param step:
+        :param displayon:
         """
-        fadeimage = ImageEnhance.Brightness(self.__displaycanvas.Image)
-        for factor in range(start, (end + step), step):
-            fadedimage = fadeimage.enhance(factor / 10.0)
-            self.__displaycanvas.paste(fadedimage, (0, 0))
-            self.__updatedisplay()
-            time.sleep(0.1)
+        self.__notifier.set_displayon(displayon)
+        for listener in self.__powerlisteners:
+            listener(displayon)
+
+    def __fade_matrix_canvas(self, start, end, step, stepseconds):
+        """
+        Fade the Matrix canvas between states 'on' and 'off'. The Matrix canvas itself is left unchanged
+
+        :param start: The fade level to start at (0 = off, self.__fader.levels = fully on)
+        :param end: The fade level to finish at
+        :param step: 1 to fade in, -1 to fade out
+        :param stepseconds: The seconds each level is shown for
+        """
+        self.__stats.record_fade()
+        for level in range(start, (end + step), step):
+            if self.__fader.usehardware:
+                self.__displaybuffer.brightness = self.__fader.brightness(level)
+                self.__displaybuffer.SetImage(self.__displaycanvas.Image, 0, 0, unsafe=True)
+            else:
+                self.__displaybuffer.SetImage(self.__fader.scaled_image(self.__displaycanvas, level), 0, 0,
+                                              unsafe=True)
+            self.__displaybuffer = self.__display.SwapOnVSync(self.__displaybuffer)
+            time.sleep(stepseconds)
+
+        # Both buffers now hold faded frames
+        self.__fullframesneeded = 2
+        self.__lastframe = None
 
-    def __paste_to_displaycanvas(self, canvasposition, canvasimage):
+    def __paste_to_displaycanvas(self, canvasposition, canvasimage, damage=None):
         """
-        Pastes another canvas (weather or time) to the Matrix canvas, and then the Matrix Canvas to the LED Matrix
-        itself
+        Pastes the damaged regions of another canvas (weather or time) to the Matrix canvas
 
         :param canvasposition:
         :param canvasimage:
+        :param damage: The regions of canvasimage to paste, or None to paste all of it
         """
         canvasstart_x = canvasposition[0]
         canvasstart_y = canvasposition[1]
         canvassize_x = canvasimage.get_canvassize_x
         canvassize_y = canvasimage.get_canvassize_y
-        canvasend_x = canvasstart_x + canvassize_x - 1
-        canvasend_y = canvasstart_y + canvassize_y - 1
 
-        # If the image is off the screen, don't draw any of it
-        if canvasstart_x <= self.__displaysize_x - 1 and canvasstart_y <= self.__displaysize_y - 1 \
-                and canvasend_x >= 0 and canvasend_y >= 0:
+        if damage is None:
+            damage = [(0, 0, canvassize_x, canvassize_y)]
+
+        for box in damage:
             # Create a crop box to stop the canvas exceeding off the Matrix Canvas area
-            imagebox = (0, 0, min(self.__displaysize_x - canvasstart_x, canvassize_x),
-                        min(self.__displaysize_y - canvasstart_y, canvassize_y))
-            imagetopaste = canvasimage.crop(imagebox)
-            imagetopaste.load()
+            imagebox = (max(box[0], -canvasstart_x), max(box[1], -canvasstart_y),
+                        min(box[2], self.__displaysize_x - canvasstart_x),
+                        min(box[3], self.__displaysize_y - canvasstart_y))
+
+            # If the region is off the screen, don't draw any of it
+            if imagebox[0] < imagebox[2] and imagebox[1] < imagebox[3]:
+                self.__displaycanvas.copy_from(canvasimage, imagebox,
+                                               (canvasstart_x + imagebox[0], canvasstart_y + imagebox[1]))
+
+    def __updatedisplay(self, damage=None):
+        """
+        Sends the Matrix canvas to the LED Matrix, unless it is identical to the frame already being shown
+
+        :param damage: The regions of the Matrix canvas changed since the last update, or None if it all may have
+        :return: True if the frame was sent, False if it was skipped
+        """
+        if damage is None:
+            damage = [(0, 0, self.__displaysize_x, self.__displaysize_y)]
 
-            # Paste the imagetopaste to the Matrix Canvas
-            self.__displaycanvas.paste(imagetopaste, (canvasstart_x, canvasstart_y))
+        frame = self.__displaycanvas.tobytes()
+        if frame == self.__lastframe:
+            self.__stats.record_skipped()
+            return False
+        self.__lastframe = frame
 
-    def __updatedisplay(self):
-        self.__displaybuffer.SetImage(self.__displaycanvas.Image, 0, 0, unsafe=True)
-        self.__display.SwapOnVSync(self.__displaybuffer)
+        uploadstart = time.perf_counter()
+        if self.__fullframesneeded:
+            if self.__fader.usehardware:
+                self.__displaybuffer.brightness = self.__fader.brightness(self.__fader.levels)
+            self.__displaybuffer.SetImage(self.__displaycanvas.Image, 0, 0, unsafe=True)
+            self.__fullframesneeded -= 1
+        else:
+            # Bring the back buffer up to date with both this frame's and the previous frame's changes
+            for box in self.__merge_regions(damage + self.__lastuploaded):
+                region = self.__displaycanvas.crop(box)
+                self.__displaybuffer.SetImage(region, box[0], box[1], unsafe=True)
+        self.__lastuploaded = damage
+
+        swapstart = time.perf_counter()
+        self.__displaybuffer = self.__display.SwapOnVSync(self.__displaybuffer)
+        self.__stats.record_stage('setimage', swapstart - uploadstart)
+        self.__stats.record_stage('swap', time.perf_counter() - swapstart)
+        return True
+
+    @staticmethod
+    def __merge_regions(regions):
+        """
+        Merges overlapping regions, so no pixel is uploaded twice
+
+        :param regions: A list of (left, top, right, bottom) boxes
+        :return: A list of non-overlapping boxes covering all the regions
+        """
+        merged = []
+        for box in regions:
+            overlapping = [other for other in merged
+                           if box[0] < other[2] and other[0] < box[2] and box[1] < other[3] and other[1] < box[3]]
+            while overlapping:
+                merged = [other for other in merged if other not in overlapping]
+                box = bounding_box(overlapping + [box])
+                overlapping = [other for other in merged
+                               if box[0] < other[2] and other[0] < box[2] and box[1] < other[3] and other[1] < box[3]]
+            merged.append(box)
+        return merged
@@ -0,0 +1,87 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    A thread safe cache which drops the least recently used entries once they take more than maxsize. The size of an
+    entry is 1 unless a sizefunction is given, so by default maxsize is the most entries kept
+    """
+
+    def __init__(self, maxsize, sizefunction=None):
+        """
+        :param maxsize: The most the entries may take before the least recently used are dropped
+        :param sizefunction: Called as sizefunction(value) to give the size of an entry, e.g. its bytes. None counts
+                             each entry as 1
+        """
+        self.__maxsize = maxsize
+        self.__sizefunction = sizefunction
+
+        self.__entries = OrderedDict()
+        self.__size = 0
+        self.__lock = threading.Lock()
+
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+
+    def get(self, key):
+        """
+        Returns the entry for a key, counting it as a hit and making it the most recently used, or None (a miss)
+
+        :param key:
+        :return: The entry, or None if it is not kept
+        """
+        with self.__lock:
+            value = self.__entries.get(key)
+            if value is None:
+                self.__misses += 1
+            else:
+                self.__entries.move_to_end(key)
+                self.__hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Keeps an entry, dropping the least recently used until the cache is back within maxsize. The newest entry is
+        always kept, even if it is bigger than maxsize on its own
+
+        :param key:
+        :param value: The entry, which must not be None
+        :return: The entry now kept for the key. If another thread kept one first, that one is returned and value is
+                 dropped, so every caller shares the same entry
+        """
+        with self.__lock:
+            kept = self.__entries.get(key)
+            if kept is not None:
+                return kept
+
+            self.__entries[key] = value
+            self.__size += self.__entry_size(value)
+            while self.__size > self.__maxsize and len(self.__entries) > 1:
+                _, dropped = self.__entries.popitem(last=False)
+                self.__size -= self.__entry_size(dropped)
+                self.__evictions += 1
+            return value
+
+    def clear(self):
+        """ Empties the cache """
+        with self.__lock:
+            self.__entries.clear()
+            self.__size = 0
+
+    @property
+    def stats(self):
+        """ Returns a dictionary of the cache usage """
+        with self.__lock:
+            return {'entries': len(self.__entries),
+                    'size': self.__size,
+                    'maxsize': self.__maxsize,
+                    'hits': self.__hits,
+                    'misses': self.__misses,
+                    'evictions': self.__evictions}
+
+    def __entry_size(self, value):
+        if self.__sizefunction is None:
+            return 1
+        return self.__sizefunction(value)
@@ -0,0 +1,214 @@
+import os
+import sys
+
+from PIL import Image
+
+# The display backends that can be chosen at startup
+BACKENDS = ('rgbmatrix', 'memory', 'png', 'terminal')
+
+
+class MemoryFrameCanvas:
+    """
+    An in-memory stand-in for the rgbmatrix FrameCanvas
+    """
+
+    def __init__(self, width, height):
+        self.__image = Image.new('RGB', (width, height))
+        self.brightness = 100
+
+    @property
+    def width(self):
+        return self.__image.width
+
+    @property
+    def height(self):
+        return self.__image.height
+
+    def SetImage(self, image, offset_x=0, offset_y=0, unsafe=True):
+        self.__image.paste(image.convert('RGB'), (offset_x, offset_y))
+
+    def Clear(self):
+        self.__image.paste((0, 0, 0), (0, 0, self.__image.width, self.__image.height))
+
+    @property
+    def Image(self):
+        """ The canvas as it would look on the matrix, with the brightness applied """
+        if self.brightness >= 100:
+            return self.__image
+        return self.__image.point(lambda value: value * self.brightness // 100)
+
+
+class MemoryMatrix:
+    """
+    A matrix which keeps the frame being shown in memory instead of driving the LEDs, with the same interface as the
+    rgbmatrix RGBMatrix used by the LEDDisplay
+    """
+
+    def __init__(self, width, height):
+        self.__width = width
+        self.__height = height
+        self.__frontbuffer = MemoryFrameCanvas(width, height)
+        self.__swaps = 0
+        self.brightness = 100
+
+    @property
+    def width(self):
+        return self.__width
+
+    @property
+    def height(self):
+        return self.__height
+
+    @property
+    def swaps(self):
+        """ The number of frames shown """
+        return self.__swaps
+
+    @property
+    def frame(self):
+        """ The image being shown """
+        return self.__frontbuffer.Image
+
+    def Clear(self):
+        self.__frontbuffer.Clear()
+
+    def CreateFrameCanvas(self):
+        return MemoryFrameCanvas(self.__width, self.__height)
+
+    def SwapOnVSync(self, framecanvas):
+        """
+        Shows framecanvas, and returns the canvas previously shown so it can be drawn on
+
+        :param framecanvas:
+        :return:
+        """
+        previous = self.__frontbuffer
+        self.__frontbuffer = framecanvas
+        self.__swaps += 1
+        self.show_frame(self.frame)
+        return previous
+
+    def show_frame(self, image):
+        """
+        Called each time a new frame is shown
+
+        :param image: The frame being shown
+        """
+        pass
+
+
+class PNGSequenceMatrix(MemoryMatrix):
+    """
+    A matrix which saves every frame shown as a numbered PNG file
+    """
+
+    def __init__(self, width, height, directory):
+        """
+        :param width:
+        :param height:
+        :param directory: The directory the frames are saved to
+        """
+        self.__directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        super(PNGSequenceMatrix, self).__init__(width, height)
+
+    def show_frame(self, image):
+        image.save(os.path.join(self.__directory, 'frame{:06d}.png'.format(self.swaps)))
+
+
+class TerminalMatrix(MemoryMatrix):
+    """
+    A matrix drawn in an ANSI (24 bit colour) terminal. Each character shows two pixels, one above the other, and only
+    the characters whose pixels have changed are redrawn
+    """
+
+    def __init__(self, width, height, output=sys.stdout):
+        self.__output = output
+        self.__cells = {}
+
+        super(TerminalMatrix, self).__init__(width, height)
+
+        # Clear the terminal and hide the cursor
+        self.__output.write('\x1b[2J\x1b[?25l')
+
+    def show_frame(self, image):
+        pixels = image.load()
+        changes = []
+        for row in range(0, self.height, 2):
+            for column in range(self.width):
+                top = pixels[column, row]
+                bottom = pixels[column, row + 1] if row + 1 < self.height else (0, 0, 0)
+                if self.__cells.get((column, row)) != (top, bottom):
+                    self.__cells[(column, row)] = (top, bottom)
+                    changes.append('\x1b[{};{}H\x1b[38;2;{};{};{}m\x1b[48;2;{};{};{}m▀'.format(
+                        row // 2 + 1, column + 1, top[0], top[1], top[2], bottom[0], bottom[1], bottom[2]))
+        if changes:
+            self.__output.write(''.join(changes) + '\x1b[0m')
+            self.__output.flush()
+
+
+def create_rgbmatrix(screendefinition):
+    """
+    Creates the rgbmatrix RGBMatrix driving the LEDs. rgbmatrix is only imported here, so the other backends can be
+    used where it is not installed
+
+    :param screendefinition: The LEDFormat from config_leddisplay
+    :return:
+    """
+    from rgbmatrix import RGBMatrix, RGBMatrixOptions
+
+    options = RGBMatrixOptions()
+
+    options.hardware_mapping = screendefinition['matrixDriver']
+    options.rows = screendefinition['matrixRows']
+    options.cols = screendefinition['matrixCols']
+    options.chain_length = screendefinition['matrixCount']
+    options.pixel_mapper_config = screendefinition['matrixMapper']
+
+    options.row_address_type = 0
+    options.multiplexing = 0
+    options.pwm_bits = 11
+    options.brightness = 100
+    options.pwm_lsb_nanoseconds = 130
+    options.led_rgb_sequence = "RGB"
+    options.show_refresh_rate = 0
+
+    return RGBMatrix(options=options)
+
+
+def matrix_size(screendefinition):
+    """
+    Works out the size of the display from the matrices and the way they are mapped, as rgbmatrix would
+
+    :param screendefinition: The LEDFormat from config_leddisplay
+    :return: (width, height)
+    """
+    width = screendefinition['matrixCols'] * screendefinition['matrixCount']
+    height = screendefinition['matrixRows']
+    for mapper in screendefinition['matrixMapper'].split(';'):
+        if mapper == 'U-mapper':
+            width, height = width // 2, height * 2
+        elif mapper in ('Rotate:90', 'Rotate:270'):
+            width, height = height, width
+    return width, height
+
+
+def create_matrix(screendefinition, backend, framesdirectory=None):
+    """
+    Creates the matrix the LEDDisplay draws on
+
+    :param screendefinition: The LEDFormat from config_leddisplay
+    :param backend: One of BACKENDS
+    :param framesdirectory: The directory the 'png' backend saves frames to
+    :return:
+    """
+    if backend == 'rgbmatrix':
+        return create_rgbmatrix(screendefinition)
+
+    width, height = matrix_size(screendefinition)
+    if backend == 'png':
+        return PNGSequenceMatrix(width, height, framesdirectory)
+    if backend == 'terminal':
+        return TerminalMatrix(width, height)
+    return MemoryMatrix(width, height)
@@ -0,0 +1,173 @@
+import asyncio
+import threading
+from time import sleep
+
+
+class ChangeNotifier:
+    """
+    Lets the threads that draw the canvases (and the PIR) wake the LEDDisplay as soon as something has changed, so the
+    display can sleep until there is work to do rather than polling
+    """
+
+    def __init__(self):
+        self.__condition = threading.Condition()
+        self.__pending = False
+
+        # The widgets sleep through sleep() so they can be held while the display is off. They have their own
+        # condition so notify doesn't wake them
+        self.__power = threading.Condition()
+        self.__displayon = True
+        self.__wakeups = 0
+
+    def notify(self):
+        """ Tell the waiting thread something has changed """
+        with self.__condition:
+            self.__pending = True
+            self.__condition.notify_all()
+
+    def wait(self, timeout=None):
+        """
+        Waits until notify has been called since the last wait returned
+
+        :param timeout: The most seconds to wait, or None to wait forever
+        :return: True if there was a notification, False if the wait timed out
+        """
+        with self.__condition:
+            notified = self.__condition.wait_for(lambda: self.__pending, timeout)
+            self.__pending = False
+        return notified
+
+    def set_displayon(self, displayon):
+        """
+        Holds the widgets in sleep while the display is off, and wakes them all as it turns back on
+
+        :param displayon: False when the display has faded out, True when it is about to fade in
+        """
+        with self.__power:
+            self.__displayon = displayon
+            if displayon:
+                self.__wakeups += 1
+            self.__power.notify_all()
+
+    def sleep(self, seconds):
+        """
+        Used by the widgets between steps. Sleeps for seconds, then for as long as the display is off. Returns early if
+        the display turns back on, so the widget redraws straight away
+
+        :param seconds: The seconds to sleep while the display is on
+        """
+        with self.__power:
+            wakeups = self.__wakeups
+            self.__power.wait_for(lambda: self.__wakeups != wakeups, seconds)
+            self.__power.wait_for(lambda: self.__displayon)
+
+
+class WidgetThread(threading.Thread):
+    """
+    The thread a widget (a clock, weather or rotating canvas) runs in, which tells the notifier whenever the widget's
+    canvas changes, and sleeps between the widget's steps for as long as the notifier holds it
+    """
+
+    def __init__(self):
+        self.__notifier = None
+
+        super(WidgetThread, self).__init__()
+
+    def set_notifier(self, notifier):
+        """ Sets the ChangeNotifier to tell whenever the canvas changes """
+        self.__notifier = notifier
+
+    def notify_changed(self):
+        """ Tells the notifier, if there is one, the canvas has changed """
+        if self.__notifier is not None:
+            self.__notifier.notify()
+
+    def sleep_between_steps(self, seconds):
+        """ Sleeps between steps, held by the notifier while the display is off """
+        if self.__notifier is not None:
+            self.__notifier.sleep(seconds)
+        else:
+            sleep(seconds)
+
+
+class AsyncChangeNotifier:
+    """
+    A ChangeNotifier for the asyncio runtime, where the LEDDisplay is a coroutine waiting on the event loop. notify may
+    be called from the loop or from any other thread
+    """
+
+    def __init__(self):
+        # The events are made by the first wait or sleep, in the running loop, as before Python 3.10 an Event belongs to
+        # the loop current when it is made. Until then, notify and set_displayon just record what they were told
+        self.__lock = threading.Lock()
+        self.__loop = None
+        self.__event = None
+        self.__displayon = None
+        self.__wakeup = None
+        self.__changed = False
+        self.__on = True
+
+    def notify(self):
+        """ Tell the waiting coroutine something has changed """
+        with self.__lock:
+            if self.__loop is None:
+                # Nothing is waiting yet
+                self.__changed = True
+                return
+        self.__loop.call_soon_threadsafe(self.__event.set)
+
+    async def wait(self):
+        """ Waits until notify has been called since the last wait returned """
+        self.__bind()
+        await self.__event.wait()
+        self.__event.clear()
+
+    def set_displayon(self, displayon):
+        """
+        Holds the widgets in sleep while the display is off, and wakes them all as it turns back on. May be called from
+        any thread
+
+        :param displayon: False when the display has faded out, True when it is about to fade in
+        """
+        with self.__lock:
+            if self.__loop is None:
+                self.__on = displayon
+                return
+        self.__loop.call_soon_threadsafe(self.__set_displayon, displayon)
+
+    async def sleep(self, seconds):
+        """
+        Used by the widgets between steps. Sleeps for seconds, then for as long as the display is off. Returns early if
+        the display turns back on, so the widget redraws straight away
+
+        :param seconds: The seconds to sleep while the display is on
+        """
+        self.__bind()
+        try:
+            await asyncio.wait_for(self.__wakeup.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        await self.__displayon.wait()
+
+    def __bind(self):
+        """ Makes the events in the running loop, from what was recorded before it was running """
+        with self.__lock:
+            if self.__loop is not None:
+                return
+            self.__event = asyncio.Event()
+            if self.__changed:
+                self.__event.set()
+            self.__displayon = asyncio.Event()
+            if self.__on:
+                self.__displayon.set()
+            self.__wakeup = asyncio.Event()
+            self.__loop = asyncio.get_running_loop()
+
+    def __set_displayon(self, displayon):
+        if displayon:
+            self.__displayon.set()
+            # Wake everything sleeping now, and give later sleeps a fresh event to wait on
+            self.__wakeup.set()
+            self.__wakeup = asyncio.Event()
+        else:
+            self.__displayon.clear()
@@ -1,42 +1,81 @@
 import threading
-from time import time, sleep
 
-import RPi.GPIO as GPIO
 
-
-class PIR(threading.Thread):
+class PIR:
     """
     Detects whether there has been movement around the clock, and turns the matrix off if there has not been any
     """
 
-    def __init__(self, pirpin, nomovementforseconds):
-        self.__pin = pirpin
+    def __init__(self, pirinput, nomovementforseconds, debounceseconds=0.05):
+        """
+        :param pirinput: Where the PIR is read from, a GPIOInput or SimulatedInput (see pirinput)
+        :param nomovementforseconds: The seconds without movement before the matrix is turned off
+        :param debounceseconds: How long the PIR output must be steady after a change before it is believed
+        """
+        self.__input = pirinput
         self.__delay = nomovementforseconds
-
-        GPIO.setup(self.__pin, GPIO.IN)
+        self.__debounce = debounceseconds
 
         self.__hasbeenmovement = True
+        self.__notifier = None
 
-        super(PIR, self).__init__()
+        self.__lock = threading.Lock()
+        self.__debouncetimer = None
+        self.__nomovementtimer = None
 
-    def run(self):
+    def start(self):
         """
-        Waits to see if there is movement within self.__delay seconds
-        If there is none, fades the matrix to black and stops it from being updated.
-        Once movement is seen, fades the screen back on.
+        Starts watching the PIR. Rather than polling it, the PIR output changing (an edge) wakes it. Once the output
+        has been steady for the debounce time it is read: movement turns the matrix on straight away, and no movement
+        starts a timer which turns it off after self.__delay seconds unless there is movement first
         """
-        t = time()
-
-        while True:
-            while GPIO.input(self.__pin) == 0:
-                if (time() - t) >= self.__delay:
-                    self.__hasbeenmovement = False
-                sleep(0.1)
-
-            self.__hasbeenmovement = True
-            t = time()
-            sleep(0.1)
+        self.__input.add_edge_callback(self.__edge)
+        self.__settled()
 
     @property
     def hasbeenmovement(self):
         return self.__hasbeenmovement
+
+    def set_notifier(self, notifier):
+        """ Sets the ChangeNotifier to tell whenever movement starts or stops """
+        self.__notifier = notifier
+
+    def __edge(self):
+        """ Called whenever the PIR output changes. Waits for it to settle before reading it """
+        with self.__lock:
+            if self.__debouncetimer is not None:
+                self.__debouncetimer.cancel()
+            self.__debouncetimer = self.__start_timer(self.__debounce, self.__settled)
+
+    def __settled(self):
+        """ Reads the PIR once its output has stopped changing """
+        movement = self.__input.read() != 0
+        with self.__lock:
+            if self.__nomovementtimer is not None:
+                self.__nomovementtimer.cancel()
+                self.__nomovementtimer = None
+            if movement:
+                self.__set_movement(True)
+            else:
+                self.__nomovementtimer = self.__start_timer(self.__delay, self.__no_movement)
+
+    def __no_movement(self):
+        """ Called once there has been no movement for self.__delay seconds """
+        with self.__lock:
+            # Movement seen just as the timer fired replaces (and cancels) it, and wins
+            if self.__nomovementtimer is threading.current_thread():
+                self.__nomovementtimer = None
+                self.__set_movement(False)
+
+    def __set_movement(self, movement):
+        if movement != self.__hasbeenmovement:
+            self.__hasbeenmovement = movement
+            if self.__notifier is not None:
+                self.__notifier.notify()
+
+    @staticmethod
+    def __start_timer(seconds, function):
+        timer = threading.Timer(seconds, function)
+        timer.daemon = True
+        timer.start()
+        return timer
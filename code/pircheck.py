@@ -0,0 +1,100 @@
+"""
+Checks the display turns off and back on at the right times, by driving the PIR from the simulated input's cycle, so the
+debounce and the no movement timeout can be tried without a Pi, the LED Matrix or anyone walking past:
+    python3 pircheck.py --movement 2 --still 4 --delay 1 --cycles 2
+
+The display should turn off the delay after the movement stops (once the PIR has settled and the display has faded
+out), and back on as soon as the movement starts again. Exits with 1 if it doesn't
+"""
+import sys
+import threading
+from argparse import ArgumentParser
+from time import monotonic, sleep
+
+from config_leddisplay import LEDFormat
+from leddisplay import FADE_LEVELS, FADE_OUT_STEP, LEDDisplay
+from matrixbackend import create_matrix
+from pir_gpio import PIR
+from pirinput import SimulatedInput
+
+# How far from the expected time the display may turn off or on
+TOLERANCE = 0.3
+
+
+def expected_changes(movementseconds, stillseconds, delay, debounce, cycles):
+    """
+    Returns when the display should turn off and on
+
+    :param movementseconds: The seconds of movement in each cycle
+    :param stillseconds: The seconds without movement in each cycle
+    :param delay: The seconds without movement before the display turns off
+    :param debounce: The seconds the PIR output must be steady before it is believed
+    :param cycles: The number of cycles
+    :return: A list of (seconds after the cycle started, True for on or False for off)
+    """
+    fadeout = (FADE_LEVELS + 1) * FADE_OUT_STEP
+    changes = []
+    for cycle in range(cycles):
+        cyclestart = cycle * (movementseconds + stillseconds)
+        changes.append((cyclestart + movementseconds + debounce + delay + fadeout, False))
+        changes.append((cyclestart + movementseconds + stillseconds + debounce, True))
+    return changes
+
+
+def run_check(movementseconds, stillseconds, delay, debounce, cycles):
+    """
+    Runs the display from a simulated PIR, and compares when it turned off and on with when it should have
+
+    :return: True if every change happened within TOLERANCE of when it should have
+    """
+    changes = []
+    lock = threading.Lock()
+
+    def power_changed(displayon):
+        with lock:
+            changes.append((monotonic() - started, displayon))
+
+    started = monotonic()
+    pir = PIR(SimulatedInput(movementseconds, stillseconds), delay, debounce)
+    display = LEDDisplay(LEDFormat, {}, pir, create_matrix(LEDFormat, 'memory'))
+    display.daemon = True
+    display.add_power_listener(power_changed)
+    pir.start()
+    display.start()
+
+    expected = expected_changes(movementseconds, stillseconds, delay, debounce, cycles)
+    sleep(expected[-1][0] + TOLERANCE + 0.5)
+
+    with lock:
+        changes = list(changes)
+    passed = len(changes) == len(expected)
+    print('{:>6} {:>10} {:>10}'.format('', 'expected', 'actual'))
+    for index, (expectedtime, displayon) in enumerate(expected):
+        actualtime = changes[index][0] if index < len(changes) and changes[index][1] == displayon else None
+        ok = actualtime is not None and abs(actualtime - expectedtime) <= TOLERANCE
+        passed = passed and ok
+        print('{:>6} {:>9.2f}s {:>10} {}'.format('on' if displayon else 'off', expectedtime,
+                                                 '-' if actualtime is None else '{:.2f}s'.format(actualtime),
+                                                 '' if ok else 'WRONG'))
+    return passed
+
+
+def main():
+    parser = ArgumentParser(description='Check the display turns off and on as the simulated PIR sees movement')
+    parser.add_argument('--movement', type=float, default=2.0, help='the seconds of movement in each cycle')
+    parser.add_argument('--still', type=float, default=4.0, help='the seconds without movement in each cycle')
+    parser.add_argument('--delay', type=float, default=1.0, help='the seconds without movement before turning off')
+    parser.add_argument('--debounce', type=float, default=0.05, help='the seconds the PIR must be steady for')
+    parser.add_argument('--cycles', type=int, default=2, help='the number of cycles to check')
+    arguments = parser.parse_args()
+
+    fadeout = (FADE_LEVELS + 1) * FADE_OUT_STEP
+    if arguments.still <= arguments.debounce + arguments.delay + fadeout:
+        parser.error('--still must be longer than the debounce, the delay and the {:.1f}s fade'.format(fadeout))
+
+    if not run_check(arguments.movement, arguments.still, arguments.delay, arguments.debounce, arguments.cycles):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
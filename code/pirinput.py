@@ -0,0 +1,122 @@
+import threading
+from time import monotonic
+
+# The PIR inputs that can be chosen at startup
+PIR_INPUTS = ('gpio', 'simulated')
+
+
+class GPIOInput:
+    """
+    Reads the PIR connected to a GPIO pin. RPi.GPIO is only imported here, so the simulated input can be used where it
+    is not installed
+    """
+
+    def __init__(self, pin):
+        """
+        :param pin: The (BCM numbered) pin the PIR output is connected to
+        """
+        import RPi.GPIO as GPIO
+
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setwarnings(False)
+        GPIO.setup(pin, GPIO.IN)
+
+        self.__gpio = GPIO
+        self.__pin = pin
+
+    def read(self):
+        """ Returns 1 if the PIR can see movement, otherwise 0 """
+        return self.__gpio.input(self.__pin)
+
+    def add_edge_callback(self, callback):
+        """
+        Calls callback() (from the RPi.GPIO thread) each time the PIR output rises or falls
+
+        :param callback:
+        """
+        self.__gpio.add_event_detect(self.__pin, self.__gpio.BOTH, callback=lambda channel: callback())
+
+
+class SimulatedInput:
+    """
+    A stand-in for the PIR. It either sees movement until told otherwise with set(), or repeatedly sees movement for
+    movementseconds then none for stillseconds. Like the GPIO input, it calls the edge callback whenever what it sees
+    changes, so the PIR timing can be tried without a Pi
+    """
+
+    def __init__(self, movementseconds=None, stillseconds=0):
+        """
+        :param movementseconds: The seconds of movement in each cycle, or None to only change when set() is called
+        :param stillseconds: The seconds without movement in each cycle
+        """
+        self.__movementseconds = movementseconds
+        self.__stillseconds = stillseconds
+        self.__started = monotonic()
+        self.__value = 1
+        self.__callback = None
+
+    def set(self, value):
+        """
+        Sets what the PIR sees, stopping any cycle
+
+        :param value: 1 for movement, 0 for none
+        """
+        changed = value != self.read()
+        self.__movementseconds = None
+        self.__value = value
+        if changed and self.__callback is not None:
+            self.__callback()
+
+    def add_edge_callback(self, callback):
+        """
+        Calls callback() (from a timer thread, or the caller of set()) each time what the PIR sees changes
+
+        :param callback:
+        """
+        self.__callback = callback
+        if self.__movementseconds is not None and self.__stillseconds > 0:
+            self.__schedule_edge()
+
+    def read(self):
+        """ Returns 1 if the PIR can see movement, otherwise 0 """
+        if self.__movementseconds is None:
+            return self.__value
+
+        position = (monotonic() - self.__started) % (self.__movementseconds + self.__stillseconds)
+        return 1 if position < self.__movementseconds else 0
+
+    def __schedule_edge(self):
+        """ Starts a timer for the next change in the cycle """
+        cycle = self.__movementseconds + self.__stillseconds
+        position = (monotonic() - self.__started) % cycle
+        if position < self.__movementseconds:
+            untiledge = self.__movementseconds - position
+        else:
+            untiledge = cycle - position
+        timer = threading.Timer(untiledge, self.__cycle_edge)
+        timer.daemon = True
+        timer.start()
+
+    def __cycle_edge(self):
+        # set() stops the cycle
+        if self.__movementseconds is None:
+            return
+        self.__callback()
+        self.__schedule_edge()
+
+
+def create_pir_input(pirinput, pin, simulatedcycle=None):
+    """
+    Creates the PIR input
+
+    :param pirinput: One of PIR_INPUTS
+    :param pin: The GPIO pin the PIR is connected to
+    :param simulatedcycle: For the simulated input, the (movement, still) seconds it repeats, or None to always see
+                           movement
+    :return:
+    """
+    if pirinput == 'gpio':
+        return GPIOInput(pin)
+    if simulatedcycle is not None:
+        return SimulatedInput(*simulatedcycle)
+    return SimulatedInput()
@@ -0,0 +1,291 @@
+import json
+import os
+import resource
+import socketserver
+import stat
+import tempfile
+import threading
+from time import time, sleep, localtime, perf_counter
+
+# Histogram buckets are powers of two of microseconds: bucket 0 is under 1us, bucket n is 2^(n-1)us to 2^n us, and
+# the last bucket holds everything above about 8 seconds
+HISTOGRAM_BUCKETS = 24
+
+
+class Histogram:
+    """
+    A fixed size histogram of durations, cheap enough to record every frame
+    """
+
+    def __init__(self):
+        self.__buckets = [0] * HISTOGRAM_BUCKETS
+        self.__count = 0
+        self.__total = 0.0
+        self.__max = 0.0
+
+    def record(self, seconds):
+        """
+        Adds a duration to the histogram
+
+        :param seconds:
+        """
+        bucket = min(int(seconds * 1000000).bit_length(), HISTOGRAM_BUCKETS - 1)
+        self.__buckets[bucket] += 1
+        self.__count += 1
+        self.__total += seconds
+        if seconds > self.__max:
+            self.__max = seconds
+
+    @property
+    def count(self):
+        return self.__count
+
+    def percentile(self, fraction):
+        """
+        Returns the upper bound (in microseconds) of the bucket holding the given fraction of the durations
+
+        :param fraction: e.g. 0.5 for the median
+        :return:
+        """
+        target = fraction * self.__count
+        seen = 0
+        for bucket, count in enumerate(self.__buckets):
+            seen += count
+            if count and seen >= target:
+                return 1 << bucket
+        return 0
+
+    @property
+    def snapshot(self):
+        """ Returns the histogram as a dictionary, with times in microseconds """
+        count = self.__count
+        return {'count': count,
+                'mean_us': round(self.__total * 1000000 / count, 1) if count else 0,
+                'max_us': round(self.__max * 1000000, 1),
+                'p50_us': self.percentile(0.5),
+                'p90_us': self.percentile(0.9),
+                'p99_us': self.percentile(0.99),
+                'buckets': list(self.__buckets)}
+
+
+class RenderStats:
+    """
+    The timings and counts of the frames drawn by the LEDDisplay
+    """
+
+    # The stages of drawing a frame that are timed
+    STAGES = ('compose', 'setimage', 'swap', 'frame')
+
+    def __init__(self):
+        self.__started = time()
+        self.__stages = {stage: Histogram() for stage in self.STAGES}
+        # The whole frame time for each hour of the day, to show how it changes through the day
+        self.__framebyhour = [Histogram() for _ in range(24)]
+        self.__components = {}
+        self.__frames = 0
+        self.__skippedframes = 0
+        self.__fades = 0
+
+    def record_stage(self, stage, seconds):
+        """
+        Records the time taken by one stage of a frame
+
+        :param stage: One of STAGES
+        :param seconds:
+        """
+        self.__stages[stage].record(seconds)
+        if stage == 'frame':
+            self.__frames += 1
+            self.__framebyhour[localtime().tm_hour].record(seconds)
+
+    def record_component(self, name):
+        """
+        Counts a component being copied to the display
+
+        :param name: The name of the component
+        """
+        self.__components[name] = self.__components.get(name, 0) + 1
+
+    def record_skipped(self):
+        """ Counts a frame that was not sent because it was identical to the one shown """
+        self.__skippedframes += 1
+
+    def record_fade(self):
+        """ Counts a fade in or out """
+        self.__fades += 1
+
+    @property
+    def snapshot(self):
+        """ Returns all the statistics as a dictionary """
+        return {'time': time(),
+                'uptime': round(time() - self.__started, 1),
+                'frames': self.__frames,
+                'skippedframes': self.__skippedframes,
+                'fades': self.__fades,
+                'components': dict(self.__components),
+                'stages': {stage: self.__stages[stage].snapshot for stage in self.STAGES},
+                'framebyhour': {hour: self.__framebyhour[hour].snapshot for hour in range(24)
+                                if self.__framebyhour[hour].count}}
+
+
+class StartupTimer:
+    """
+    Times each phase of starting the clock, and how long after starting milestones such as the first frame are reached,
+    printing each as it happens so the startup time is reported on every boot
+    """
+
+    def __init__(self):
+        self.__started = perf_counter()
+        self.__phasestarted = self.__started
+        self.__phases = {}
+        self.__milestones = {}
+        self.__lock = threading.Lock()
+
+    def phase(self, name):
+        """
+        Ends the current phase, which began when the last phase ended (or the timer was created)
+
+        :param name: The name of the phase which has just ended
+        """
+        now = perf_counter()
+        with self.__lock:
+            self.__phases[name] = round((now - self.__phasestarted) * 1000, 1)
+            self.__phasestarted = now
+        print('Startup: {} took {:.1f}ms'.format(name, self.__phases[name]))
+
+    def milestone(self, name):
+        """
+        Records how long after starting something happened. Only the first time is kept
+
+        :param name: e.g. 'firstframe'
+        """
+        now = perf_counter()
+        with self.__lock:
+            if name in self.__milestones:
+                return
+            self.__milestones[name] = round((now - self.__started) * 1000, 1)
+        print('Startup: {} after {:.1f}ms'.format(name, self.__milestones[name]))
+
+    @property
+    def snapshot(self):
+        """ Returns the phase times and milestones, in milliseconds, as a dictionary """
+        with self.__lock:
+            return {'phases': dict(self.__phases),
+                    'milestones': dict(self.__milestones)}
+
+
+def process_stats():
+    """
+    Returns the resources used by the clock process, to compare the threaded and asyncio runtimes
+
+    :return: A dictionary of the resident memory (KB), context switches and number of threads
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    try:
+        # The current resident memory is only available on Linux
+        with open('/proc/self/statm') as statm:
+            rss = int(statm.read().split()[1]) * resource.getpagesize() // 1024
+    except (OSError, ValueError, IndexError):
+        rss = None
+    return {'rss_kb': rss,
+            'maxrss_kb': usage.ru_maxrss,
+            'voluntary_switches': usage.ru_nvcsw,
+            'involuntary_switches': usage.ru_nivcsw,
+            'cpu_seconds': round(usage.ru_utime + usage.ru_stime, 2),
+            'threads': threading.active_count()}
+
+
+class StatsFileWriter(threading.Thread):
+    """
+    Writes the statistics to a JSON file every few seconds, replacing the file in one go so it can be read at any time
+    """
+
+    def __init__(self, statsfunction, filename, interval):
+        """
+        :param statsfunction: A function returning the statistics as a dictionary
+        :param filename: The file to write
+        :param interval: The seconds between writes
+        """
+        self.__statsfunction = statsfunction
+        self.__filename = filename
+        self.__interval = interval
+
+        super(StatsFileWriter, self).__init__(daemon=True)
+
+    def run(self):
+        while True:
+            sleep(self.__interval)
+            self.write()
+
+    @property
+    def interval(self):
+        return self.__interval
+
+    def write(self):
+        """
+        Writes the statistics once. They are written to a new temporary file with a name no one else can choose, so
+        nothing planted in the directory is written through
+        """
+        directory, name = os.path.split(self.__filename)
+        try:
+            descriptor, temporaryfile = tempfile.mkstemp(prefix=name + '.', suffix='.tmp', dir=directory or '.')
+        except OSError as error:
+            print('Error writing statistics: {}'.format(error))
+            return
+        try:
+            with os.fdopen(descriptor, 'w') as statsfile:
+                json.dump(self.__statsfunction(), statsfile)
+            os.chmod(temporaryfile, 0o644)
+            os.replace(temporaryfile, self.__filename)
+        except OSError as error:
+            print('Error writing statistics: {}'.format(error))
+            os.remove(temporaryfile)
+
+
+class StatsSocketServer(threading.Thread):
+    """
+    Serves the statistics as JSON to anything connecting to a Unix socket, e.g.
+    socat - UNIX-CONNECT:/run/piclock/renderstats.sock
+    """
+
+    def __init__(self, statsfunction, socketpath):
+        """
+        :param statsfunction: A function returning the statistics as a dictionary
+        :param socketpath: The path of the Unix socket
+        """
+        self.__statsfunction = statsfunction
+        self.__socketpath = socketpath
+
+        super(StatsSocketServer, self).__init__(daemon=True)
+
+    def run(self):
+        statsfunction = self.__statsfunction
+
+        class StatsHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                self.wfile.write(json.dumps(statsfunction()).encode() + b'\n')
+
+        try:
+            remove_stale_socket(self.__socketpath)
+        except OSError as error:
+            print('Error serving statistics: {}'.format(error))
+            return
+        with socketserver.UnixStreamServer(self.__socketpath, StatsHandler) as server:
+            server.serve_forever()
+
+
+def remove_stale_socket(socketpath):
+    """
+    Removes the socket left by the last run, so a new one can be made in its place. Anything else at the path is left
+    alone
+
+    :param socketpath: The path of the Unix socket
+    :raises FileExistsError: If there is something other than a socket at the path
+    """
+    try:
+        mode = os.lstat(socketpath).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError('{} exists and is not a socket'.format(socketpath))
+    os.remove(socketpath)
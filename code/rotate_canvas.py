@@ -1,8 +1,10 @@
-import threading
-from time import sleep
+from time import monotonic
 
+from notifier import WidgetThread
+from snapshot import CanvasSnapshot
 
-class RotateCanvas(threading.Thread):
+
+class RotateCanvas(WidgetThread):
 
     def __init__(self, canvaslist, rotateinterval):
         """
@@ -13,9 +15,11 @@ class RotateCanvas(threading.Thread):
         """
         self.__canvases = canvaslist
         self.__interval = rotateinterval
-        self.__currentcanvas = 0
 
-        self.__HasImageChanged = True
+        # (number of rotations so far, canvas being shown), replaced as a whole so a reader never sees one without the
+        # other
+        self.__rotation = (0, 0)
+        self.__nextrotation = None
 
         super(RotateCanvas, self).__init__()
 
@@ -23,23 +27,55 @@ class RotateCanvas(threading.Thread):
         """
         Swaps the canvases listed in self.__canvases every self.__interval seconds
         """
-        canvascount = len(self.__canvases)
-        canvas = self.__currentcanvas
         while True:
-            self.__currentcanvas = canvas
-            self.__HasImageChanged = True
-            canvas = (canvas + 1) % canvascount
-            sleep(self.__interval)
+            self.sleep_between_steps(self.step())
 
-    @property
-    def haschanged(self):
-        if self.__HasImageChanged:
-            self.__HasImageChanged = False
-            return True
-        else:
-            return False
+    def step(self):
+        """
+        Swaps to the next canvas if it is time to
+
+        :return: The seconds until the next swap
+        """
+        now = monotonic()
+        if self.__nextrotation is None:
+            self.__nextrotation = now + self.__interval
+        elif now >= self.__nextrotation:
+            self.rotate()
+            self.__nextrotation += self.__interval
+            if self.__nextrotation <= now:
+                # Start again from now after a pause (e.g. while the display was off), rather than catching up
+                self.__nextrotation = now + self.__interval
+        return max(self.__nextrotation - now, 0)
+
+    def rotate(self):
+        """ Swaps to the next canvas """
+        rotations, canvas = self.__rotation
+        self.__rotation = (rotations + 1, (canvas + 1) % len(self.__canvases))
+        self.notify_changed()
+
+    def set_notifier(self, notifier):
+        """ Sets the ChangeNotifier to tell whenever the canvas changes, for this and each canvas it shows """
+        super(RotateCanvas, self).set_notifier(notifier)
+        for canvas in self.__canvases:
+            canvas.set_notifier(notifier)
 
     @property
     def get_canvas(self):
-        """ Returns the canvas """
-        return self.__canvases[self.__currentcanvas].get_canvas
+        """ Returns the canvas being shown, as it was last published """
+        return self.__canvases[self.__rotation[1]].get_canvas
+
+    def changes_since(self, generation):
+        """
+        Returns the latest snapshot of the canvas being shown, and the regions changed since an earlier generation.
+        The generation of a rotated canvas is (number of rotations, generation of the canvas shown), so the whole
+        canvas is redrawn after each rotation
+
+        :param generation: The generation last drawn, or None
+        :return: (CanvasSnapshot, damage). See CanvasPublisher.changes_since
+        """
+        rotations, canvas = self.__rotation
+        if generation is not None and generation[0] == rotations:
+            snapshot, damage = self.__canvases[canvas].changes_since(generation[1])
+        else:
+            snapshot, damage = self.__canvases[canvas].changes_since(None)
+        return CanvasSnapshot(snapshot.canvas, (rotations, snapshot.generation), damage), damage
@@ -0,0 +1,185 @@
+import heapq
+import math
+import threading
+from time import time
+
+# The ways the widgets can be run: a thread each, all of them from the Scheduler, or all on one asyncio event loop
+RUNTIMES = ('threads', 'scheduler', 'asyncio')
+
+# The resolution of the scheduler in seconds. Jobs due in the same tick are run together in one wakeup
+TICK = 0.01
+
+
+class ScheduledJob:
+    """
+    A job held by the Scheduler
+    """
+    __slots__ = ('name', 'function', 'period', 'align', 'tick', 'runs')
+
+    def __init__(self, name, function, period, align):
+        self.name = name
+        self.function = function
+        self.period = period
+        self.align = align
+        self.tick = None
+        self.runs = 0
+
+
+class Scheduler(threading.Thread):
+    """
+    Runs the widgets' periodic work from one thread. Each job's run is moved onto a wall clock boundary (e.g. the start
+    of a second, or of a 5 minute period), and the runs are kept in a timer wheel of TICK sized buckets, so jobs due at
+    the same time are run together in a single wakeup rather than each waking the CPU on its own schedule and drifting
+    """
+
+    def __init__(self):
+        # The wheel maps a tick to the names of the jobs due in it, and the heap holds the ticks which have jobs
+        self.__jobs = {}
+        self.__wheel = {}
+        self.__ticks = []
+        self.__lock = threading.Lock()
+        self.__wake = threading.Event()
+        self.__paused = False
+
+        self.__started = time()
+        self.__wakeups = 0
+        self.__runwakeups = 0
+        self.__jobsrun = 0
+        self.__maxlate = 0.0
+
+        super(Scheduler, self).__init__(daemon=True)
+
+    def add_job(self, name, function, period, align=None):
+        """
+        Adds a job, which is first run straight away
+
+        :param name: The name of the job, used to trigger it and in the statistics
+        :param function: Called each time the job is due. If it returns a number, the job is next run that many seconds
+                         later rather than period seconds later (so a widget's step() can be used)
+        :param period: The seconds between runs, or None to only run it again when it is triggered
+        :param align: Move each run to the next wall clock multiple of this many seconds (e.g. 1 to run at the start of
+                      each second), or None to run exactly period seconds after the last run
+        """
+        job = ScheduledJob(name, function, period, align)
+        with self.__lock:
+            self.__jobs[name] = job
+            self.__schedule(job, self.__tick(time()))
+        self.__wake.set()
+
+    def trigger(self, name):
+        """
+        Runs a job as soon as possible, e.g. because the data it draws has arrived
+
+        :param name: The name of the job. Nothing happens if there is no such job (yet)
+        """
+        with self.__lock:
+            if name not in self.__jobs:
+                return
+            self.__schedule(self.__jobs[name], self.__tick(time()))
+        self.__wake.set()
+
+    def set_paused(self, paused):
+        """
+        Stops running the jobs, e.g. while the display is off, or starts them again. Every job is run straight away when
+        they are started again, so the display is brought up to date
+
+        :param paused: True to stop running the jobs, False to start them again
+        """
+        with self.__lock:
+            self.__paused = paused
+            if not paused:
+                nowtick = self.__tick(time())
+                for job in self.__jobs.values():
+                    self.__schedule(job, nowtick)
+        self.__wake.set()
+
+    def run(self):
+        while True:
+            with self.__lock:
+                # While paused, sleep until woken rather than until the next job is due
+                nexttick = self.__ticks[0] if self.__ticks and not self.__paused else None
+
+            timeout = None if nexttick is None else nexttick * TICK - time()
+            if timeout is None or timeout > 0:
+                self.__wake.wait(timeout)
+                self.__wake.clear()
+                self.__wakeups += 1
+                # Woken early to add or trigger a job, or the tick has come; either way work out what is due again
+                if timeout is None or nexttick * TICK > time():
+                    continue
+
+            self.__run_due()
+
+    @property
+    def stats(self):
+        """ Returns the number of wakeups and job runs as a dictionary """
+        with self.__lock:
+            uptime = time() - self.__started
+            return {'paused': self.__paused,
+                    'wakeups': self.__wakeups,
+                    'wakeups_per_second': round(self.__wakeups / uptime, 3) if uptime > 0 else 0,
+                    'jobsrun': self.__jobsrun,
+                    'coalesced': self.__jobsrun - self.__runwakeups,
+                    'maxlate_ms': round(self.__maxlate * 1000, 1),
+                    'jobs': {name: job.runs for name, job in self.__jobs.items()}}
+
+    def __run_due(self):
+        """ Runs every job whose tick has come """
+        now = time()
+        nowtick = self.__tick(now)
+        due = []
+        with self.__lock:
+            while self.__ticks and self.__ticks[0] <= nowtick:
+                tick = heapq.heappop(self.__ticks)
+                for name in self.__wheel.pop(tick):
+                    job = self.__jobs[name]
+                    # A job moved by trigger() is still listed in the bucket it was moved from
+                    if job.tick == tick:
+                        job.tick = None
+                        due.append(job)
+                        self.__maxlate = max(self.__maxlate, now - tick * TICK)
+
+        if not due:
+            return
+        self.__runwakeups += 1
+
+        for job in due:
+            # One widget failing mustn't stop the thread running all the others
+            try:
+                result = job.function()
+            except Exception as error:
+                print('Error running {}: {!r}'.format(job.name, error))
+                result = None
+            job.runs += 1
+            self.__jobsrun += 1
+
+            delay = job.period if result is None else result
+            if delay is None:
+                continue
+            nexttick = self.__tick(time() + delay)
+            if job.align is not None:
+                # Work in whole ticks so rounding can't move a run past its boundary, and allow a tick of slack so a job
+                # asking to run at the next boundary isn't pushed to the one after it
+                alignticks = max(int(round(job.align / TICK)), 1)
+                nexttick = -(-(nexttick - 1) // alignticks) * alignticks
+            with self.__lock:
+                if job.tick is None:
+                    self.__schedule(job, nexttick)
+
+    def __schedule(self, job, tick):
+        """
+        Puts a job in the wheel bucket for a tick. Must be called with the lock held
+
+        :param job:
+        :param tick:
+        """
+        job.tick = tick
+        if tick not in self.__wheel:
+            self.__wheel[tick] = []
+            heapq.heappush(self.__ticks, tick)
+        self.__wheel[tick].append(job.name)
+
+    @staticmethod
+    def __tick(seconds):
+        """ Returns the tick a wall clock time falls in, rounding up """
+        return math.ceil(round(seconds / TICK, 6))
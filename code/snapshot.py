@@ -0,0 +1,85 @@
+import threading
+from collections import deque
+
+from canvas import bounding_box
+
+# The number of generations whose damage is remembered. A reader further behind than this redraws the whole canvas
+DAMAGE_HISTORY = 8
+
+
+class CanvasSnapshot:
+    """
+    An immutable copy of a canvas, as it was when it was published
+    """
+    __slots__ = ('canvas', 'generation', 'damage')
+
+    def __init__(self, canvas, generation, damage):
+        """
+        :param canvas: A copy of the canvas, which must not be drawn on
+        :param generation: Increases each time the canvas is published
+        :param damage: The regions changed since the previous generation, or None if all of it may have changed
+        """
+        self.canvas = canvas
+        self.generation = generation
+        self.damage = damage
+
+
+class CanvasPublisher:
+    """
+    Publishes snapshots of a canvas which is drawn on by one thread (the back buffer) so another thread can read them
+    (the front buffer) without seeing a half drawn canvas
+    """
+
+    def __init__(self, canvas):
+        """
+        :param canvas: The canvas the owner draws on
+        """
+        self.__canvas = canvas
+        self.__lock = threading.Lock()
+        self.__history = deque(maxlen=DAMAGE_HISTORY)
+        self.__snapshot = CanvasSnapshot(canvas.copy(), 0, None)
+        canvas.take_damage()
+
+    @property
+    def snapshot(self):
+        """ Returns the latest snapshot """
+        return self.__snapshot
+
+    def publish(self):
+        """
+        Publishes the canvas as a new generation, if it has been drawn on since it was last published
+
+        :return: True if a new generation was published
+        """
+        damage = self.__canvas.take_damage()
+        if not damage:
+            return False
+
+        with self.__lock:
+            snapshot = CanvasSnapshot(self.__canvas.copy(), self.__snapshot.generation + 1, damage)
+            self.__history.append(snapshot)
+            self.__snapshot = snapshot
+        return True
+
+    def changes_since(self, generation):
+        """
+        Returns the latest snapshot, and the regions which have changed since an earlier generation
+
+        :param generation: The generation the reader last drew, or None if it has not drawn one
+        :return: (snapshot, damage). damage is an empty list if nothing has changed, or None if the whole canvas must be
+        redrawn
+        """
+        with self.__lock:
+            snapshot = self.__snapshot
+            if generation == snapshot.generation:
+                return snapshot, []
+            if generation is None or generation < snapshot.generation - len(self.__history):
+                return snapshot, None
+
+            damage = []
+            for published in self.__history:
+                if published.generation > generation:
+                    damage.extend(published.damage)
+        if len(damage) > DAMAGE_HISTORY:
+            damage = [bounding_box(damage)]
+        return snapshot, damage
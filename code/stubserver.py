@@ -0,0 +1,149 @@
+"""
+A local stand-in for the OpenWeatherMap.org forecast API, serving recorded forecasts, so the reading of the forecast can
+be tested and benchmarked without the network or an OpenWeatherMap key
+
+Every request, whatever its path, is answered with the next recorded forecast in turn, moved in time so it is current.
+It is gzipped if asked for, has an ETag (so an unchanged forecast is answered with 304 Not Modified), and can be made
+slow or made to fail:
+    python3 stubserver.py --port 8080 --latency 0.2 --errors 0.1 benchdata/owm_forecast.json
+then point WeatherURLFormat at http://localhost:8080/forecast?id={}&APPID={}
+"""
+import copy
+import gzip
+import hashlib
+import json
+import random
+import threading
+import time
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from weatherprovider import shift_forecast
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    Serves recorded forecasts as OpenWeatherMap.org does
+    """
+    daemon_threads = True
+
+    def __init__(self, replayfiles, port=0, latency=0.0, jitter=0.0, errorrate=0.0, hangrate=0.0, hangseconds=60.0):
+        """
+        :param replayfiles: The recorded forecast JSON files, served in turn
+        :param port: The port to listen on (on localhost), or 0 for any free port
+        :param latency: The seconds to wait before answering each request
+        :param jitter: Up to this many more seconds are added to the latency at random
+        :param errorrate: The fraction of requests answered with 500 Internal Server Error
+        :param hangrate: The fraction of requests which hang for hangseconds before being answered, as a stuck
+                         connection would
+        :param hangseconds:
+        """
+        self.__recorded = []
+        for filename in replayfiles:
+            with open(filename) as replayfile:
+                self.__recorded.append(json.load(replayfile))
+        self.__nextforecast = 0
+        self.__lock = threading.Lock()
+
+        self.latency = latency
+        self.jitter = jitter
+        self.errorrate = errorrate
+        self.hangrate = hangrate
+        self.hangseconds = hangseconds
+
+        self.requests = 0
+        self.notmodified = 0
+        self.errors = 0
+
+        super(StubServer, self).__init__(('127.0.0.1', port), StubHandler)
+
+    @property
+    def url(self):
+        """ The URL to read the forecast from, in the form of WeatherURLFormat """
+        return 'http://127.0.0.1:{}/data/2.5/forecast?id={{}}&APPID={{}}'.format(self.server_address[1])
+
+    def start(self):
+        """ Serves requests on a daemon thread """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def next_forecast(self):
+        """
+        Returns the next forecast to serve, as the body of the response
+
+        :return: The JSON, as bytes
+        """
+        with self.__lock:
+            self.requests += 1
+            forecast = self.__recorded[self.__nextforecast]
+            self.__nextforecast = (self.__nextforecast + 1) % len(self.__recorded)
+        return json.dumps(shift_forecast(copy.deepcopy(forecast))).encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """ Answers a request to the StubServer """
+    protocol_version = 'HTTP/1.1'
+    # The headers and body are written separately, so don't let the second wait for the first to be acknowledged
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        delay = server.latency + random.uniform(0, server.jitter)
+        if random.random() < server.hangrate:
+            delay += server.hangseconds
+        if delay > 0:
+            time.sleep(delay)
+
+        if random.random() < server.errorrate:
+            server.errors += 1
+            self.__send(500, b'{"cod": 500, "message": "injected error"}')
+            return
+
+        body = server.next_forecast()
+        etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            server.notmodified += 1
+            self.__send(304, b'', {'ETag': etag})
+            return
+
+        headers = {'ETag': etag, 'Content-Type': 'application/json'}
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            headers['Content-Encoding'] = 'gzip'
+        self.__send(200, body, headers)
+
+    def __send(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """ Requests are not logged, so benchmarks aren't slowed down """
+        pass
+
+
+def main():
+    parser = ArgumentParser(description='Serve recorded forecasts as OpenWeatherMap.org does')
+    parser.add_argument('replayfiles', nargs='+', help='the recorded forecast JSON files, served in turn')
+    parser.add_argument('--port', type=int, default=8080, help='the port to listen on')
+    parser.add_argument('--latency', type=float, default=0.0, help='the seconds to wait before each answer')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many more seconds at random')
+    parser.add_argument('--errors', type=float, default=0.0, help='the fraction of requests answered with 500')
+    parser.add_argument('--hangs', type=float, default=0.0, help='the fraction of requests which hang')
+    parser.add_argument('--hang-seconds', type=float, default=60.0, help='how long a hung request hangs for')
+    arguments = parser.parse_args()
+
+    server = StubServer(arguments.replayfiles, arguments.port, arguments.latency, arguments.jitter, arguments.errors,
+                        arguments.hangs, arguments.hang_seconds)
+    print('Serving {} recorded forecast(s) at {}'.format(len(arguments.replayfiles), server.url))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
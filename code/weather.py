@@ -1,26 +1,27 @@
-import math
-import threading
-from time import sleep, strptime
+from config_images import GlyphText
+from framebuffer import create_framebuffer
+from getweatherdata import DEFAULT_LOCATION
+from notifier import WidgetThread
+from snapshot import CanvasPublisher
 
-from canvas import Canvas
 
-
-class Weather(threading.Thread):
+class Weather(WidgetThread):
     """
     Updates the weather conditions from the Weather file, and updates the screen when necessary.
-    Only updates every UpdateInterval (seconds), or 10 minutes if there is an error
+    Only updates when the GetWeatherData says there is a new forecast, or a forecast slot has ended
     """
 
-    def __init__(self, weatherdefinition, hours_from_now, update_interval, getweatherobject):
+    def __init__(self, weatherdefinition, hours_from_now, getweatherobject, framebuffer='pil',
+                 location=DEFAULT_LOCATION):
         self.__WeatherDefinition = weatherdefinition
-        self.__UpdateInterval = update_interval
 
-        self.__WeatherCanvas = Canvas(weatherdefinition['Size'][0], weatherdefinition['Size'][1])
-        self.__HasImageChanged = True
+        self.__WeatherCanvas = create_framebuffer(weatherdefinition['Size'][0], weatherdefinition['Size'][1],
+                                                  framebuffer)
+        self.__Publisher = CanvasPublisher(self.__WeatherCanvas)
 
         self.__GetWeatherObject = getweatherobject
         self.__WeatherData = []
-        self.__WeatherForecast = {}
+        self.__WeatherForecast = None
         self.__CurrentWeatherIcon = ''
         self.__CurrentWeatherWind = -1
         self.__CurrentWeatherRain = -1.0
@@ -33,128 +34,143 @@ class Weather(threading.Thread):
         self.__WindSpeedIcon = -1
         self.__RainSnowIcon = ''
         self.__HoursFromNow = hours_from_now
+        self.__Location = location
+        self.__PlaceholderDrawn = False
 
         super(Weather, self).__init__()
 
     def run(self):
         while True:
-            # Read the weather from TheWeather thread
-
-            weather = self.__GetWeatherObject.get_weatherforecast(self.__HoursFromNow)
-            delay = 300
-
-            # If there was a read error (happens when the time is too close to the
-            # next forecast, read the one 3 hours ahead instead
-            if weather is None:
-                weather = self.__GetWeatherObject.get_weatherforecast(self.__HoursFromNow + 3)
+            # Read the version first, so an update arriving while drawing isn't missed
+            version = self.__GetWeatherObject.version
+            self.step()
+            self.__GetWeatherObject.wait_for_update(version)
+            # Don't draw while the display is off; the update is drawn when it comes back on
+            self.sleep_between_steps(0)
+
+    def step(self):
+        """
+        Draws the forecast if it has changed, and publishes the canvas. Called whenever the GetWeatherData has an
+        update, so nothing is drawn unless the slot shown has changed
 
-            if weather is not None:
-                self.__WeatherForecast = self.__get_readable_forecast(weather)
+        :return: None, as there is nothing to do until the next update
+        """
+        # Until the first forecast has been read, show a placeholder rather than holding up the rest of the display
+        if not self.__GetWeatherObject.has_forecasts(self.__Location):
+            self.__draw_placeholder()
+            if self.__Publisher.publish():
+                self.notify_changed()
+            return None
 
-                # Draw the weather forecast canvas
-                self.__draw_weather_canvas()
+        # Read the weather from TheWeather thread
+        weather = self.__GetWeatherObject.get_weatherforecast(self.__HoursFromNow, self.__Location)
 
-                # Don't update for the update interval or 5 minutes if there has been an error
-                delay = self.__UpdateInterval
-            else:
-                print("Error in weather")
+        if weather is None:
+            print("Error in weather")
+        elif weather is not self.__WeatherForecast:
+            # Slots are never changed, so the same slot as last time has already been drawn
+            self.__WeatherForecast = weather
 
-            sleep(delay)
+            # Draw the weather forecast canvas
+            self.__draw_weather_canvas()
+            if self.__Publisher.publish():
+                self.notify_changed()
 
-    @property
-    def haschanged(self):
-        if self.__HasImageChanged:
-            self.__HasImageChanged = False
-            return True
-        else:
-            return False
+        return None
 
     @property
     def get_canvas(self):
-        """ Returns the canvas """
-        return self.__WeatherCanvas
+        """ Returns the canvas as it was last published. It must not be drawn on """
+        return self.__Publisher.snapshot.canvas
+
+    def changes_since(self, generation):
+        """
+        Returns the latest snapshot of the canvas, and the regions changed since an earlier generation
+
+        :param generation: The generation last drawn, or None
+        :return: (CanvasSnapshot, damage). See CanvasPublisher.changes_since
+        """
+        return self.__Publisher.changes_since(generation)
 
     def __draw_weather_canvas(self):
         """ Draw the new Weather canvas according to the definition """
         # Go through each item, updating any images if required
         current_weather = self.__WeatherForecast
-        if current_weather == {}:
-            self.__HasImageChanged = False
+        if current_weather is None:
             self.__WeatherReadError = True
         else:
-            self.__HasImageChanged = False
 
             # Weather Icon
             if self.__WeatherDefinition['WeatherIcon'] != ():
-                if self.__CurrentWeatherIcon != current_weather['icon']:
-                    self.__CurrentWeatherIcon = current_weather['icon']
+                if self.__CurrentWeatherIcon != current_weather.icon:
+                    self.__CurrentWeatherIcon = current_weather.icon
                     self.__drawicon_weather()
-                    self.__HasImageChanged = True
 
             # Max temperature
             if self.__WeatherDefinition['MaxTemp'] != ():
-                if self.__CurrentWeatherMaxTemp != current_weather['MaxTemp']:
-                    self.__CurrentWeatherMaxTemp = current_weather['MaxTemp']
+                if self.__CurrentWeatherMaxTemp != current_weather.maxtemp:
+                    self.__CurrentWeatherMaxTemp = current_weather.maxtemp
                     self.__draw_temperature('MaxTemp', self.__CurrentWeatherMaxTemp, 'C')
-                    self.__HasImageChanged = True
 
             # Min temperature
             if self.__WeatherDefinition['MinTemp'] != ():
-                if self.__CurrentWeatherMinTemp != current_weather['MinTemp']:
-                    self.__CurrentWeatherMinTemp = current_weather['MinTemp']
+                if self.__CurrentWeatherMinTemp != current_weather.mintemp:
+                    self.__CurrentWeatherMinTemp = current_weather.mintemp
                     self.__draw_temperature('MinTemp', self.__CurrentWeatherMinTemp, 'C')
-                    self.__HasImageChanged = True
 
             # Wind speed Icon
             if self.__WeatherDefinition['WindSpeedIcon'] != ():
                 if not self.__WindSpeedIcon:
                     self.__drawicon_windspeed()
-                    self.__HasImageChanged = True
                     self.__WindSpeedIcon = True
 
             # Wind Speed
             if self.__WeatherDefinition['WindSpeed'] != ():
-                windspeedtobeaufort = current_weather['beaufort']
+                windspeedtobeaufort = current_weather.beaufort
                 if self.__CurrentWeatherWind != windspeedtobeaufort:
                     self.__CurrentWeatherWind = windspeedtobeaufort
                     self.__draw_windspeed()
-                    self.__HasImageChanged = True
 
             # Rain or snow Icon?
             # If there is snow, replace the rain icon with snow icon
             if self.__WeatherDefinition['RainSnowIcon'] != ():
                 # We have snow!
-                if current_weather['snow'] > 0:
+                if current_weather.snow > 0:
                     self.__CurrentWeatherRain = -1.0
                     if self.__RainSnowIcon != 'snow':
                         self.__drawicon_rainsnow('SnowIcon')
-                        self.__HasImageChanged = True
                         self.__RainSnowIcon = 'snow'
 
-                    if self.__CurrentWeatherSnow != current_weather['snow']:
-                        self.__CurrentWeatherSnow = current_weather['snow']
+                    if self.__CurrentWeatherSnow != current_weather.snow:
+                        self.__CurrentWeatherSnow = current_weather.snow
                         self.__draw_snowfall()
-                    self.__HasImageChanged = True
 
                 # Booo! Rain
                 else:
                     self.__CurrentWeatherSnow = -1.0
                     if self.__RainSnowIcon != 'rain':
                         self.__drawicon_rainsnow('RainIcon')
-                        self.__HasImageChanged = True
                         self.__RainSnowIcon = 'rain'
 
-                    if self.__CurrentWeatherRain != current_weather['rain']:
-                        self.__CurrentWeatherRain = current_weather['rain']
+                    if self.__CurrentWeatherRain != current_weather.rain:
+                        self.__CurrentWeatherRain = current_weather.rain
                         self.__draw_rainfall()
-                        self.__HasImageChanged = True
 
             # Weather Time Indicator (indicator of the 3 hours the forecast covers)
             if self.__WeatherDefinition['WeatherTime'] != ():
-                if self.__CurrentWeatherTime != current_weather['WeatherTime']:
-                    self.__CurrentWeatherTime = current_weather['WeatherTime']
+                if self.__CurrentWeatherTime != current_weather.weathertime:
+                    self.__CurrentWeatherTime = current_weather.weathertime
                     self.__drawicon_weathertime()
-                    self.__HasImageChanged = True
+
+    def __draw_placeholder(self):
+        """ Draws dashes in place of the temperatures, to show the forecast has not been read yet """
+        if self.__PlaceholderDrawn:
+            return
+        self.__PlaceholderDrawn = True
+        for maxmin in ('MaxTemp', 'MinTemp'):
+            if self.__WeatherDefinition[maxmin] != ():
+                GlyphText.draw(self.__WeatherCanvas, self.__WeatherDefinition[maxmin],
+                               ('max' if maxmin == 'MaxTemp' else 'min', 'ssp', '-', '-', '.', '-'))
 
     def __drawicon_rainsnow(self, whichicon):
         self.__WeatherCanvas.draw_on_canvas(self.__WeatherDefinition['RainSnowIcon'], whichicon)
@@ -189,193 +205,18 @@ class Weather(threading.Thread):
         :param unit:
         :return:
         """
-        x = self.__WeatherDefinition[maxmin][0]
-        y = self.__WeatherDefinition[maxmin][1]
-        image = self.__WeatherDefinition[maxmin][2]
-        imagedefinition = self.__WeatherDefinition[maxmin][3]
-
-        # The Max/Min arrow
-        if maxmin == 'MaxTemp':
-            self.__WeatherCanvas.draw_on_canvas((x, y, image, imagedefinition), 'max')
-            x = self.__add_image_width(x, imagedefinition['max'])
-        else:
-            self.__WeatherCanvas.draw_on_canvas((x, y, image, imagedefinition), 'min')
-            x = self.__add_image_width(x, imagedefinition['min'])
+        glyphs = ['max' if maxmin == 'MaxTemp' else 'min']
 
         # temperature is below 0
-        if temperature < 0:
-            self.__WeatherCanvas.draw_on_canvas((x, y, image, imagedefinition), '-')
-            x = self.__add_image_width(x, imagedefinition['-'])
-        else:
-            self.__WeatherCanvas.draw_on_canvas((x, y, image, imagedefinition), 'ssp')
-            x = self.__add_image_width(x, imagedefinition['ssp'])
-
-        # 10's digit
-        if temperature >= 10.0:
-            tensdigit = str(abs(int(temperature)))[0]
-            self.__WeatherCanvas.draw_on_canvas((x, y, image, imagedefinition), tensdigit)
-            x = self.__add_image_width(x, imagedefinition[tensdigit])
-        else:
-            tensdigit = 0
-            self.__WeatherCanvas.draw_on_canvas((x, y, image, imagedefinition), 'sp')
-            x = self.__add_image_width(x, imagedefinition['sp'])
+        glyphs.append('-' if temperature < 0 else 'ssp')
 
-        # Units digit
-        unitdigit = str(abs(int(temperature)) - int(tensdigit) * 10)
-        self.__WeatherCanvas.draw_on_canvas((x, y, image, imagedefinition), unitdigit)
-        x = self.__add_image_width(x, imagedefinition[unitdigit])
+        # 10's digit, then units digit
+        wholedegrees = str(abs(int(temperature)))
+        if len(wholedegrees) == 1:
+            wholedegrees = ('sp', wholedegrees)
+        glyphs.extend(wholedegrees)
 
-        # Decimal point
-        self.__WeatherCanvas.draw_on_canvas((x, y, image, imagedefinition), '.')
-        x = self.__add_image_width(x, imagedefinition['.'])
-
-        # Decimal
-        dec = str(int(abs(temperature) * 10 % 10))
-        self.__WeatherCanvas.draw_on_canvas((x, y, image, imagedefinition), dec)
-        x = self.__add_image_width(x, imagedefinition[dec])
-
-        # temperature unit
-        self.__WeatherCanvas.draw_on_canvas((x, y, image, imagedefinition), unit)
-
-    def __get_readable_forecast(self, weatherdict):
-        """
-        Converts the weather for the defined time (weather_forecast_time) into a readable (list) format
-
-        :param weatherdict:
-        """
-        weatherdata = {}
-
-        if weatherdict == {}:
-            print('The json was blank!')
-        else:
-            try:
-                weatherdata['MaxTemp'] = self.__kelvin_to_celsius(weatherdict['main']['temp_max'])
-                weatherdata['MinTemp'] = self.__kelvin_to_celsius(weatherdict['main']['temp_min'])
-                weatherdata['humidity'] = int(weatherdict['main']['humidity'])
-
-                # If [rain][3h] is in the forecast, set it, or set rainfall to 0mm
-                if 'rain' in weatherdict:
-                    if '3h' in weatherdict['rain']:
-                        weatherdata['rain'] = min(8.0, math.ceil(float(weatherdict['rain']['3h'] * 2)) / 2.0)
-                    else:
-                        weatherdata['rain'] = 0.0
-                else:
-                    weatherdata['rain'] = 0.0
-
-                if 'snow' in weatherdict:
-                    if '3h' in weatherdict['snow']:
-                        weatherdata['snow'] = min(16, int(math.ceil(float(weatherdict['snow']['3h']))))
-                    else:
-                        weatherdata['snow'] = 0
-                else:
-                    weatherdata['snow'] = -1
-
-                weatherdata['description'] = weatherdict['weather'][0]['description']
-                weatherdata['wind'] = float(weatherdict['wind']['speed'])
-                weatherdata['beaufort'] = self.__windspeed_to_beaufort(float(weatherdict['wind']['speed']))
-                weatherdata['winddir'] = self.__degrees_to_direction(float(weatherdict['wind']['deg']))
-                weatherdata['icon'] = weatherdict['weather'][0]['icon']
-                weatherdata['WeatherTime'] = strptime(weatherdict['dt_txt'], '%Y-%m-%d %H:%M:%S').tm_hour
-                weatherdata['dt_txt'] = weatherdict['dt_txt']
-            except:
-                print('Error __get_readable_forecast')
-            finally:
-                return weatherdata
-
-    @staticmethod
-    def __kelvin_to_celsius(kelvin):
-        """
-        Converts the temperature from Kelvins to Celsius
-
-        :param kelvin:
-        :return: The temperature in Celsius
-        """
-        return round(float(kelvin) - 273.15, 1)
-
-    @staticmethod
-    def __windspeed_to_beaufort(windspeedmps):
-        """
-        Converts the wind speed from m/s to Beaufort scale
-
-        :param windspeedmps:
-        :return:
-        """
-        beaufort = 0
-
-        if windspeedmps <= 2.0:
-            beaufort = 1
-        elif windspeedmps <= 3.0:
-            beaufort = 2
-        elif windspeedmps <= 5.0:
-            beaufort = 3
-        elif windspeedmps <= 8.0:
-            beaufort = 4
-        elif windspeedmps <= 11.0:
-            beaufort = 5
-        elif windspeedmps <= 14.0:
-            beaufort = 6
-        elif windspeedmps <= 17.0:
-            beaufort = 7
-        elif windspeedmps <= 21.0:
-            beaufort = 8
-        elif windspeedmps <= 24.0:
-            beaufort = 9
-        elif windspeedmps <= 28.0:
-            beaufort = 10
-        elif windspeedmps <= 32.0:
-            beaufort = 11
-        elif windspeedmps > 32.0:
-            beaufort = 12
-
-        return beaufort
-
-    @staticmethod
-    def __degrees_to_direction(degrees):
-        """
-        Convert the wind direction from degrees to compass direction
-
-        :param degrees: The wind direction, in degrees
-        :return: Text version of the wind direction
-        """
+        # Decimal point and decimal, then the temperature unit
+        glyphs.extend(('.', str(int(abs(temperature) * 10 % 10)), unit))
 
-        winddirection = None
-
-        degrees = float(degrees)
-        if degrees <= 11.25 or degrees >= 348.76:
-            winddirection = "N"
-        elif degrees <= 33.75:
-            winddirection = "NNE"
-        elif degrees <= 56.25:
-            winddirection = "NE"
-        elif degrees <= 78.75:
-            winddirection = "ENE"
-        elif degrees <= 101.25:
-            winddirection = "E"
-        elif degrees <= 123.75:
-            winddirection = "ESE"
-        elif degrees <= 146.25:
-            winddirection = "SE"
-        elif degrees <= 168.75:
-            winddirection = "SSE"
-        elif degrees <= 191.25:
-            winddirection = "S"
-        elif degrees <= 213.75:
-            winddirection = "SSW"
-        elif degrees <= 236.25:
-            winddirection = "SW"
-        elif degrees <= 258.75:
-            winddirection = "WSW"
-        elif degrees <= 281.25:
-            winddirection = "W"
-        elif degrees <= 303.75:
-            winddirection = "WNW"
-        elif degrees <= 326.25:
-            winddirection = "NW"
-        elif degrees <= 348.75:
-            winddirection = "NNW"
-
-        return winddirection
-
-    @staticmethod
-    def __add_image_width(x, imagedef):
-        return x + imagedef[2] - imagedef[0] + 1
+        GlyphText.draw(self.__WeatherCanvas, self.__WeatherDefinition[maxmin], glyphs)
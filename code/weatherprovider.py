@@ -0,0 +1,200 @@
+import json
+import math
+import time
+
+from forecast import (FORECAST_SLOT_SECONDS, ForecastSlot, ForecastTable, derive_slots, kelvin_to_celsius,
+                      windspeed_to_beaufort)
+
+# Where the forecast can be read from: 'openweathermap' for the OpenWeatherMap.org 5 day forecast, or 'replay' for
+# forecasts recorded from it, read from files
+PROVIDERS = ('openweathermap', 'replay')
+
+
+class OpenWeatherMapProvider:
+    """
+    Reads the 5 day / 3 hour forecast from OpenWeatherMap.org (or anything serving the same JSON, such as stubserver.py)
+    """
+
+    def __init__(self, mapkey, urlformat, cityid, units):
+        """
+        :param mapkey: The OpenWeatherMap key
+        :param urlformat: The URL, with {} for the city id then the key
+        :param cityid:
+        :param units:
+        """
+        self.__url = urlformat.format(cityid, mapkey)
+        self.__units = units
+
+    @property
+    def url(self):
+        """ The URL the forecast is read from """
+        return self.__url
+
+    @property
+    def key(self):
+        """ Identifies the forecast read, so locations reading the same one can share it """
+        return self.__url
+
+    def fetch(self, session, headers, timeout):
+        """
+        Reads the forecast
+
+        :param session: The requests Session to read it with
+        :param headers: Extra request headers, e.g. to only read it if it has changed
+        :param timeout: The requests (connect, read) timeout
+        :return: (HTTP status, response headers, the forecast JSON as a dictionary or None if the status isn't 200,
+                 the bytes received as sent, the bytes once decompressed)
+        """
+        response = session.get(self.__url, headers=headers, timeout=timeout)
+        forecast = response.json() if response.status_code == 200 else None
+        # The bytes read from the socket, before they were decompressed
+        wirebytes = response.raw.tell() if hasattr(response.raw, 'tell') else len(response.content)
+        return response.status_code, response.headers, forecast, wirebytes, len(response.content)
+
+    def decode(self, forecast):
+        """
+        Decodes a forecast read from OpenWeatherMap.org, converting every slot at once. Slots which can't be read are
+        left out
+
+        :param forecast: The forecast JSON, as a dictionary
+        :return: A ForecastTable
+        """
+        slotsjson = forecast.get('list', ())
+        try:
+            return ForecastTable(self.decode_slots(slotsjson))
+        except (AttributeError, KeyError, IndexError, TypeError, ValueError):
+            # Decode slot by slot instead, so only the slots which can't be read are left out
+            pass
+
+        slots = []
+        for slotjson in slotsjson:
+            try:
+                slots.append(self.decode_slot(slotjson))
+            except (AttributeError, KeyError, IndexError, TypeError, ValueError):
+                print('Error reading a forecast slot: {!r}'.format(slotjson))
+        return ForecastTable(slots)
+
+    @staticmethod
+    def decode_slots(slotsjson):
+        """
+        Decodes every slot of the forecast at once
+
+        :param slotsjson: The 'list' in the forecast JSON
+        :return: A list of ForecastSlots
+        :raises AttributeError, KeyError, IndexError, TypeError, ValueError: If any entry is malformed
+        """
+        starttimes = []
+        maxkelvins = []
+        minkelvins = []
+        rains = []
+        snows = []
+        windspeeds = []
+        icons = []
+        for slotjson in slotsjson:
+            starttimes.append(slotjson['dt'])
+            maxkelvins.append(slotjson['main']['temp_max'])
+            minkelvins.append(slotjson['main']['temp_min'])
+            rains.append(slotjson.get('rain', {}).get('3h', 0.0))
+            snows.append(slotjson['snow'].get('3h', 0.0) if 'snow' in slotjson else -1)
+            windspeeds.append(slotjson['wind']['speed'])
+            icons.append(slotjson['weather'][0]['icon'])
+        return derive_slots(starttimes, maxkelvins, minkelvins, rains, snows, windspeeds, icons)
+
+    @staticmethod
+    def decode_slot(slotjson):
+        """
+        Decodes one slot of the forecast
+
+        :param slotjson: One entry of the 'list' in the forecast JSON
+        :return: A ForecastSlot
+        :raises AttributeError, KeyError, IndexError, TypeError, ValueError: If the entry is malformed
+        """
+        rain = slotjson.get('rain', {})
+        rain = min(8.0, math.ceil(float(rain['3h'] * 2)) / 2.0) if '3h' in rain else 0.0
+        if 'snow' in slotjson:
+            snow = slotjson['snow']
+            snow = min(16, int(math.ceil(float(snow['3h'])))) if '3h' in snow else 0
+        else:
+            snow = -1
+
+        return ForecastSlot(int(slotjson['dt']),
+                            kelvin_to_celsius(slotjson['main']['temp_max']),
+                            kelvin_to_celsius(slotjson['main']['temp_min']),
+                            rain,
+                            snow,
+                            windspeed_to_beaufort(float(slotjson['wind']['speed'])),
+                            slotjson['weather'][0]['icon'])
+
+
+class ReplayProvider(OpenWeatherMapProvider):
+    """
+    Replays forecasts recorded from OpenWeatherMap.org, one file per read in turn, without the network. Each is moved
+    in time so its first slot is the current one, so the clock shows it as if it had just been read
+    """
+
+    def __init__(self, replayfiles):
+        """
+        :param replayfiles: The recorded forecast JSON files
+        """
+        super(ReplayProvider, self).__init__('', '', '', '')
+        self.__replayfiles = replayfiles
+        self.__nextfile = 0
+
+    @property
+    def url(self):
+        """ There is no URL, so the forecast is always read with fetch() """
+        return None
+
+    @property
+    def key(self):
+        """ Identifies the forecast read, so locations reading the same one can share it """
+        return 'replay:' + '|'.join(self.__replayfiles)
+
+    def fetch(self, session, headers, timeout):
+        """
+        Reads the next recorded forecast. The arguments are ignored
+
+        :return: As OpenWeatherMapProvider.fetch
+        """
+        filename = self.__replayfiles[self.__nextfile]
+        self.__nextfile = (self.__nextfile + 1) % len(self.__replayfiles)
+        with open(filename, 'rb') as replayfile:
+            recorded = replayfile.read()
+        return 200, {}, shift_forecast(json.loads(recorded)), len(recorded), len(recorded)
+
+
+def shift_forecast(forecast, now=None):
+    """
+    Moves a recorded OpenWeatherMap forecast in time, by a whole number of slots, so its first slot is the one covering
+    now
+
+    :param forecast: The forecast JSON, as a dictionary. It is changed
+    :param now: The time to move it to, in seconds since the epoch, or None for the current time
+    :return: forecast
+    """
+    slots = forecast.get('list', [])
+    if not slots:
+        return forecast
+    now = time.time() if now is None else now
+    shift = (int(now) // FORECAST_SLOT_SECONDS * FORECAST_SLOT_SECONDS) - min(slot['dt'] for slot in slots)
+    for slot in slots:
+        slot['dt'] += shift
+        slot['dt_txt'] = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(slot['dt']))
+    return forecast
+
+
+def create_provider(provider, mapkey, urlformat, cityid, units, replayfiles=()):
+    """
+    Creates the weather provider
+
+    :param provider: One of PROVIDERS
+    :param mapkey: The OpenWeatherMap key
+    :param urlformat: The OpenWeatherMap URL, with {} for the city id then the key
+    :param cityid:
+    :param units:
+    :param replayfiles: The recorded forecast files the 'replay' provider reads
+    :return:
+    """
+    if provider == 'replay':
+        return ReplayProvider(replayfiles)
+    return OpenWeatherMapProvider(mapkey, urlformat, cityid, units)